@@ -0,0 +1,266 @@
+"""
+Seeds a database with questions, choices and votes, then measures each API
+endpoint at a fixed concurrency through gunicorn. The results are compared
+against `benchmarks/baseline.json`, and the script exits with an error when
+any of them regressed.
+
+    $ export DATABASE_URL=postgres://localhost/polls_benchmark
+    $ python manage.py migrate
+    $ python benchmarks/api.py --seed --questions 1000 --choices 4 --votes 10
+    $ python benchmarks/api.py --save-baseline
+
+Seeding replaces every question in the database. Latencies and throughput
+depend on the machine, save a baseline on the machine the benchmark is run
+on. With `--queries-only` only the queries per request are measured, which
+requires neither gunicorn nor a baseline from the same machine.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import uuid
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'polls.settings')
+os.environ.setdefault('POLLS_VOTE_RATE', '0')
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from load import free_port, load, percentile, start_server  # noqa: E402
+from polls.models import Choice, Question, Vote, fingerprint  # noqa: E402
+from polls.views import QuestionCollectionResource  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+BATCH_SIZE = 1000
+SAMPLE_SIZE = 10000
+
+
+def seed(questions, choices, votes):
+    using = Question.objects.db
+    Vote.objects.all()._raw_delete(using)
+    Choice.objects.all()._raw_delete(using)
+    Question.objects.all()._raw_delete(using)
+
+    choice_texts = ['Choice {}'.format(i) for i in range(choices)]
+    Question.objects.bulk_create(
+        (
+            Question(
+                question_text='Question {}?'.format(i),
+                fingerprint=fingerprint('Question {}?'.format(i), choice_texts),
+            )
+            for i in range(questions)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    Choice.objects.bulk_create(
+        (
+            Choice(question_id=question_pk, choice_text=text, vote_count=votes)
+            for question_pk in Question.objects.values_list('pk', flat=True)
+            for text in choice_texts
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    Vote.objects.bulk_create(
+        (
+            Vote(choice_id=choice_pk)
+            for choice_pk in Choice.objects.values_list('pk', flat=True)
+            for _ in range(votes)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    QuestionCollectionResource.count_provider.invalidate()
+
+
+def get_scenarios():
+    """
+    Returns a function for each scenario, returning the method, path and
+    body of a request to make.
+    """
+
+    choices = list(Choice.objects.values_list('question_id', 'pk')[:SAMPLE_SIZE])
+    if not choices:
+        raise SystemExit('The database has no questions, seed it with --seed')
+
+    pages = math.ceil(Question.objects.count() / QuestionCollectionResource.paginate_by)
+
+    def create():
+        body = {
+            'question': 'Benchmark {}?'.format(uuid.uuid4().hex),
+            'choices': ['Yes', 'No'],
+        }
+        return ('POST', '/questions', json.dumps(body).encode('utf-8'))
+
+    return {
+        'root': lambda: ('GET', '/', b''),
+        'questions': lambda: (
+            'GET',
+            '/questions?page={}'.format(random.randint(1, pages)),
+            b'',
+        ),
+        'question': lambda: (
+            'GET',
+            '/questions/{}'.format(random.choice(choices)[0]),
+            b'',
+        ),
+        'vote': lambda: (
+            'POST',
+            '/questions/{}/choices/{}'.format(*random.choice(choices)),
+            b'',
+        ),
+        'create': create,
+    }
+
+
+def count_queries(method, path, body):
+    """
+    Counts the queries of a request made in this process, without a cached
+    response.
+    """
+
+    cache.clear()
+    client = Client()
+
+    with CaptureQueriesContext(connection) as queries:
+        client.generic(method, path, body, 'application/json', secure=True)
+
+    return len(queries)
+
+
+def measure(port, next_request, concurrency, duration):
+    latencies, errors = asyncio.run(load(port, next_request, concurrency, duration))
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput': len(latencies) / duration,
+        'p50': percentile(latencies, 0.5) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a description of each result which is worse than the baseline by
+    more than `tolerance`, any extra query is a regression.
+    """
+
+    regressions = []
+
+    for name, result in sorted(results.items()):
+        expected = baseline.get(name, {})
+
+        def regress(metric, message):
+            regressions.append(
+                '{} {}: {} ({:.1f}, baseline {:.1f})'.format(
+                    name, metric, message, result[metric], expected[metric]
+                )
+            )
+
+        if 'queries' in expected and result['queries'] > expected['queries']:
+            regress('queries', 'more queries per request')
+
+        for metric in ('p50', 'p95', 'p99'):
+            if metric in expected and metric in result:
+                if result[metric] > expected[metric] * (1 + tolerance):
+                    regress(metric, 'slower')
+
+        if 'throughput' in expected and 'throughput' in result:
+            if result['throughput'] < expected['throughput'] * (1 - tolerance):
+                regress('throughput', 'fewer requests per second')
+
+        if result.get('errors', 0) > result.get('requests', 0) * 0.01:
+            regressions.append('{}: {} failed requests'.format(name, result['errors']))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--seed', action='store_true')
+    parser.add_argument('--questions', type=int, default=1000)
+    parser.add_argument('--choices', type=int, default=4)
+    parser.add_argument('--votes', type=int, default=10, help='Votes per choice')
+    parser.add_argument('--scenarios', nargs='+')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--queries-only', action='store_true')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.questions, args.choices, args.votes)
+
+    scenarios = get_scenarios()
+    names = args.scenarios or list(scenarios)
+    results = {name: {'queries': count_queries(*scenarios[name]())} for name in names}
+
+    if not args.queries_only:
+        port = free_port()
+        server = start_server(port, args.workers, POLLS_VOTE_RATE='0')
+        try:
+            for name in names:
+                results[name].update(
+                    measure(port, scenarios[name], args.concurrency, args.duration)
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(
+        '{:<10} {:>9} {:>7} {:>9} {:>8} {:>8} {:>8} {:>8}'.format(
+            'Scenario',
+            'requests',
+            'errors',
+            'req/s',
+            'p50 ms',
+            'p95 ms',
+            'p99 ms',
+            'queries',
+        )
+    )
+    for name in names:
+        result = dict.fromkeys(('throughput', 'p50', 'p95', 'p99'), float('nan'))
+        result.update(requests=0, errors=0)
+        result.update(results[name])
+        print(
+            '{:<10} {requests:>9} {errors:>7} {throughput:>9.1f} {p50:>8.1f} '
+            '{p95:>8.1f} {p99:>8.1f} {queries:>8}'.format(name, **result)
+        )
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+
+    if args.save_baseline:
+        for name, result in results.items():
+            baseline.setdefault(name, {}).update(result)
+
+        with open(args.baseline, 'w') as fp:
+            json.dump(baseline, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print('REGRESSION {}'.format(regression))
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
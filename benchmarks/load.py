@@ -0,0 +1,155 @@
+"""
+Measures the throughput of the API served by gunicorn workers through
+`polls.wsgi` at high concurrency. Requires gunicorn and a database with the
+initial data, responses are not cached on the server so that every request
+queries the database.
+
+    $ export DATABASE_URL=postgres://localhost/polls
+    $ python manage.py migrate && python manage.py loaddata initial_data
+    $ python benchmarks/load.py --concurrency 200 --duration 10 '/questions?page=1'
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, workers, **overrides):
+    command = [
+        sys.executable,
+        '-m',
+        'gunicorn',
+        '--bind',
+        '127.0.0.1:{}'.format(port),
+        '--workers',
+        str(workers),
+        'polls.wsgi',
+    ]
+    env = dict(
+        os.environ, SECURE_SSL_REDIRECT='false', POLLS_RESPONSE_CACHE_TIMEOUT='0'
+    )
+    env.update(overrides)
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen('http://127.0.0.1:{}/healthcheck'.format(port))
+            return server
+        except OSError:
+            time.sleep(0.1)
+
+    server.terminate()
+    raise RuntimeError('The server did not start')
+
+
+async def request(port, path, method='GET', body=b''):
+    """
+    Performs a request on a new connection, returning the status code.
+    """
+
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    head = (
+        '{} {} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n'
+        'Content-Type: application/json\r\nContent-Length: {}\r\n\r\n'
+    ).format(method, path, len(body))
+    writer.write(head.encode('ascii') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b' ', 2)[1])
+
+
+async def worker(port, next_request, deadline, latencies, errors):
+    while time.monotonic() < deadline:
+        method, path, body = next_request()
+        started = time.monotonic()
+        try:
+            status = await request(port, path, method, body)
+        except (OSError, IndexError, ValueError):
+            status = None
+
+        if status is not None and status < 400:
+            latencies.append(time.monotonic() - started)
+        else:
+            errors.append(status)
+
+
+async def load(port, next_request, concurrency, duration):
+    """
+    Makes the requests returned by `next_request` from `concurrency` clients
+    for `duration` seconds, returning the sorted latencies of the successful
+    requests and the status codes of the failed ones.
+    """
+
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    await asyncio.gather(
+        *[
+            worker(port, next_request, deadline, latencies, errors)
+            for _ in range(concurrency)
+        ]
+    )
+    return sorted(latencies), errors
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('path', nargs='?', default='/questions?page=1')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_server(port, args.workers)
+    try:
+        latencies, errors = asyncio.run(
+            load(
+                port,
+                lambda: ('GET', args.path, b''),
+                args.concurrency,
+                args.duration,
+            )
+        )
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(
+        '{:>10} {:>8} {:>10} {:>10} {:>10}'.format(
+            'requests', 'errors', 'req/s', 'p50 ms', 'p99 ms'
+        )
+    )
+    print(
+        '{:>10} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            len(latencies),
+            len(errors),
+            len(latencies) / args.duration,
+            percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.99) * 1000,
+        )
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Measures the per-request overhead of choosing a content type from the Accept
+header and looking up its handler, with and without the negotiation and
+handler caches.
+
+    $ python benchmarks/negotiation.py
+"""
+
+import os
+import sys
+import timeit
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'polls.settings')
+django.setup()
+
+from polls.resource import negotiate_content_type  # noqa: E402
+from polls.views import QuestionCollectionResource  # noqa: E402
+
+ACCEPT_HEADERS = (
+    '*/*',
+    'application/json',
+    'application/vnd.siren+json',
+    'application/hal+json, application/json;q=0.5',
+    'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+)
+NUMBER = 10000
+REPEAT = 5
+
+
+def uncached(accept):
+    content_type = negotiate_content_type.__wrapped__(accept)
+    return QuestionCollectionResource.content_handlers()[content_type]
+
+
+def cached(accept):
+    content_type = negotiate_content_type(accept)
+    return QuestionCollectionResource.get_content_handlers()[content_type]
+
+
+def measure(function, accept):
+    timings = timeit.repeat(lambda: function(accept), number=NUMBER, repeat=REPEAT)
+    return min(timings) / NUMBER
+
+
+def main():
+    print('{:<66} {:>10} {:>10}'.format('Accept', 'uncached', 'cached'))
+    for accept in ACCEPT_HEADERS:
+        before = measure(uncached, accept)
+        after = measure(cached, accept)
+        print(
+            '{:<66} {:>8.2f}us {:>8.2f}us'.format(
+                accept, before * 1000000, after * 1000000
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Measures rendering a page of 20 questions with 10 choices each in every
+supported content type, without touching the database. The page is encoded
+with the encoder selected by `POLLS_JSON_ENCODER`.
+
+With `--compare` the serializers of another git revision are measured too,
+the revision is exported to a temporary directory and measured by this
+script in a process of its own. Both must render identical documents.
+
+    $ python benchmarks/serializers.py
+    $ python benchmarks/serializers.py --compare 45a4e54^
+    $ POLLS_JSON_ENCODER=orjson python benchmarks/serializers.py
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import timeit
+import tracemalloc
+from datetime import datetime, timezone
+
+import django
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description='Measures the serializers.')
+parser.add_argument('--compare', metavar='REF', help='git revision to compare with')
+parser.add_argument('--tree', default=ROOT, help=argparse.SUPPRESS)
+parser.add_argument('--json', action='store_true', help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+sys.path.insert(0, args.tree)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'polls.settings')
+django.setup()
+
+from django.test import RequestFactory  # noqa: E402
+
+from polls import resource  # noqa: E402
+from polls.models import Choice, Question  # noqa: E402
+from polls.views import QuestionCollectionResource  # noqa: E402
+
+QUESTIONS = 20
+CHOICES = 10
+NUMBER = 300
+REPEAT = 9
+
+# Fixed so that the renders of revisions may be compared
+PUBLISHED_AT = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def encode(document):
+    # Revisions before the configurable encoders only used `json`
+    if hasattr(resource, 'encoder'):
+        return resource.encoder.encode(document)
+
+    return json.dumps(document)
+
+
+def build_page(request):
+    questions = []
+
+    for question_pk in range(1, QUESTIONS + 1):
+        question = Question(
+            pk=question_pk,
+            question_text='Question {}?'.format(question_pk),
+            published_at=PUBLISHED_AT,
+        )
+        question.ordered_choices = [
+            Choice(
+                pk=question_pk * CHOICES + choice_pk,
+                question_id=question_pk,
+                choice_text='Choice {}'.format(choice_pk),
+                vote_count=CHOICES - choice_pk,
+            )
+            for choice_pk in range(CHOICES)
+        ]
+        questions.append(question)
+
+    page = QuestionCollectionResource()
+    page.request = request
+    relations = {
+        page.relation: page.get_resources(questions),
+        'first': QuestionCollectionResource(),
+        'next': QuestionCollectionResource(cursor='cursor'),
+    }
+    page.get_relations = lambda: relations
+    return page
+
+
+def count_calls(function):
+    calls = []
+
+    def profile(frame, event, arg):
+        if event in ('call', 'c_call'):
+            calls.append(event)
+
+    sys.setprofile(profile)
+    function()
+    sys.setprofile(None)
+    return len(calls)
+
+
+def measure(page, handler):
+    def render():
+        return encode(handler(page))
+
+    content = render()
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+
+    tracemalloc.start()
+    render()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    calls = count_calls(render)
+    timings = timeit.repeat(render, number=NUMBER, repeat=REPEAT)
+    return {
+        'ms': min(timings) / NUMBER * 1000,
+        'kib': peak / 1024,
+        'calls': calls,
+        'digest': hashlib.md5(content).hexdigest(),
+    }
+
+
+def measure_tree():
+    page = build_page(RequestFactory().get('/questions'))
+    handlers = page.content_handlers()
+    return {
+        content_type: measure(page, handler)
+        for content_type, handler in sorted(handlers.items())
+    }
+
+
+def measure_revision(ref):
+    archive = subprocess.run(
+        ['git', 'archive', ref], cwd=ROOT, stdout=subprocess.PIPE, check=True
+    ).stdout
+
+    with tempfile.TemporaryDirectory() as tree:
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(tree)
+
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--tree', tree, '--json'],
+            stdout=subprocess.PIPE,
+            check=True,
+        ).stdout
+
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+def main():
+    results = measure_tree()
+    if args.json:
+        print(json.dumps(results))
+        return
+
+    revisions = [('current', results)]
+    if args.compare:
+        revisions.insert(0, (args.compare, measure_revision(args.compare)))
+
+    print(
+        '{:<28} {:<12} {:>10} {:>10} {:>8}'.format(
+            'Content type', 'Revision', 'ms/render', 'peak KiB', 'calls'
+        )
+    )
+    for content_type in sorted(results):
+        for revision, measured in revisions:
+            result = measured[content_type]
+            print(
+                '{:<28} {:<12} {ms:>10.3f} {kib:>10.1f} {calls:>8}'.format(
+                    content_type, revision, **result
+                )
+            )
+
+        digests = {measured[content_type]['digest'] for (_, measured) in revisions}
+        assert len(digests) == 1, 'The revisions render {} differently'.format(
+            content_type
+        )
+
+
+if __name__ == '__main__':
+    main()
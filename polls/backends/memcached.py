@@ -0,0 +1,10 @@
+from django.core.cache.backends.memcached import MemcachedCache
+
+from polls.caches import PooledClientMixin
+
+
+class PooledMemcachedCache(PooledClientMixin, MemcachedCache):
+    """
+    Requires the `python-memcached` package. Its client keeps a connection to
+    each server for every thread, which are kept open between requests.
+    """
@@ -0,0 +1,104 @@
+import threading
+
+from django.conf import settings
+from django.db.backends.postgresql.base import Database
+from django.db.backends.postgresql.base import DatabaseWrapper as BaseDatabaseWrapper
+from django.db.backends.postgresql.creation import (
+    DatabaseCreation as BaseDatabaseCreation,
+)
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+
+from polls.pool import ConnectionPool, PoolTimeout
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def close_pools(alias):
+    """
+    Closes the idle connections of the pools of a database.
+    """
+
+    with pools_lock:
+        closing = [pool for key, pool in pools.items() if key[0] == alias]
+
+    for pool in closing:
+        pool.close()
+
+
+class DatabaseCreation(BaseDatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # The test database cannot be dropped while pooled connections to it
+        # are open
+        close_pools(self.connection.alias)
+        super(DatabaseCreation, self)._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(BaseDatabaseWrapper):
+    """
+    Borrows connections from a pool shared by the threads of a process,
+    instead of keeping a connection open for each thread. Django gives the
+    connection back when it closes it, at the end of each request with a
+    `CONN_MAX_AGE` of 0. The pools are sized by the `DATABASE_POOL_*`
+    settings.
+    """
+
+    creation_class = DatabaseCreation
+
+    @property
+    def pool(self):
+        # Tests switch the database of a connection, which then has a pool
+        # of its own
+        params = self.get_connection_params()
+        key = (self.alias, repr(sorted(params.items())))
+
+        with pools_lock:
+            if key not in pools:
+                pools[key] = ConnectionPool(
+                    settings.DATABASE_POOL_MIN_SIZE,
+                    settings.DATABASE_POOL_MAX_SIZE,
+                    settings.DATABASE_POOL_TIMEOUT,
+                )
+
+            return pools[key]
+
+    def get_new_connection(self, conn_params):
+        connect = super(DatabaseWrapper, self).get_new_connection
+
+        try:
+            connection = self.pool.get(lambda: connect(conn_params))
+        except PoolTimeout as e:
+            raise Database.OperationalError(str(e))
+
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+
+        with self.wrap_database_errors:
+            self.pool.put(self.connection, broken=not self.reset_connection())
+
+    def reset_connection(self):
+        """
+        Rolls back the transaction in progress on the connection, returning
+        whether the connection may be reused.
+        """
+
+        if self.connection.closed:
+            return False
+
+        status = self.connection.get_transaction_status()
+        if status == TRANSACTION_STATUS_UNKNOWN:
+            return False
+
+        if status != TRANSACTION_STATUS_IDLE:
+            try:
+                self.connection.rollback()
+            except Database.Error:
+                return False
+
+        return True
@@ -0,0 +1,205 @@
+"""
+Cache backends, configured from a URL in the `CACHE_URL` environment variable
+much like the database is from `DATABASE_URL`. The Memcached backend is in
+`polls.backends` and only imported when configured, it requires the
+`python-memcached` package.
+"""
+
+import threading
+from urllib.parse import parse_qsl, urlsplit
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.functional import cached_property
+
+SCHEMES = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+    'memcached': 'polls.backends.memcached.PooledMemcachedCache',
+}
+
+
+def parse_cache_url(url):
+    """
+    Returns the `CACHES` entry of a cache URL such as `locmem://name` or
+    `memcached://host1:11211,host2:11211`. The `timeout` and `key_prefix`
+    query parameters set the `TIMEOUT` and `KEY_PREFIX` of the cache, the
+    others are options of the backend's client, for example `socket_timeout`
+    or `dead_retry` for Memcached.
+    """
+
+    parsed = urlsplit(url)
+    if parsed.scheme not in SCHEMES:
+        raise ImproperlyConfigured(
+            'Unknown cache URL scheme {!r}, expected one of {}'.format(
+                parsed.scheme, ', '.join(sorted(SCHEMES))
+            )
+        )
+
+    config = {'BACKEND': SCHEMES[parsed.scheme]}
+    options = {}
+
+    for name, value in parse_qsl(parsed.query):
+        if value.isdigit():
+            value = int(value)
+
+        if name == 'timeout':
+            config['TIMEOUT'] = value
+        elif name == 'key_prefix':
+            config['KEY_PREFIX'] = value
+        else:
+            options[name] = value
+
+    if parsed.scheme == 'memcached':
+        config['LOCATION'] = parsed.netloc.split(',')
+    else:
+        config['LOCATION'] = parsed.netloc
+
+    if options:
+        config['OPTIONS'] = options
+
+    return config
+
+
+clients = {}
+clients_lock = threading.Lock()
+
+
+class PooledClientMixin(object):
+    """
+    Shares the client of a cache, and with it its connections, between the
+    backends of a process. Django creates a backend for each thread, and
+    would otherwise close memcached connections at the end of every request.
+    """
+
+    def create_client(self):
+        return self._lib.Client(self._servers, **self._options)
+
+    @cached_property
+    def _cache(self):
+        key = (type(self), tuple(self._servers), repr(sorted(self._options.items())))
+
+        with clients_lock:
+            if key not in clients:
+                clients[key] = self.create_client()
+
+            return clients[key]
+
+    def close(self, **kwargs):
+        pass
+
+
+class TieredCache(BaseCache):
+    """
+    Keeps an LRU cache of up to `MAX_ENTRIES` values in each process in front
+    of the shared cache named by `LOCATION`, so that the hottest values are
+    read without a request to the shared cache.
+
+    Only the keys starting with one of the `LOCAL_KEY_PREFIXES` option are
+    kept locally, by default the rendered responses. Their local copies are
+    never invalidated, which is only correct for values that never change
+    once set. Responses are keyed by the generations of the data they render
+    and therefore rarely do, a process which finds a response of another
+    version renders and sets it again. Every other key is read and written in
+    the shared cache only.
+    """
+
+    def __init__(self, location, params):
+        super(TieredCache, self).__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = location
+        self.local_key_prefixes = tuple(
+            options.get('LOCAL_KEY_PREFIXES', ('polls:response:',))
+        )
+        self.local = LocMemCache(
+            'polls-tiered-{}'.format(location),
+            {
+                'TIMEOUT': params.get('TIMEOUT', DEFAULT_TIMEOUT),
+                'OPTIONS': {'MAX_ENTRIES': options.get('MAX_ENTRIES', 1000)},
+            },
+        )
+
+    @cached_property
+    def shared(self):
+        from django.core.cache import caches
+
+        return caches[self.shared_alias]
+
+    def is_local(self, key):
+        return key.startswith(self.local_key_prefixes)
+
+    def get(self, key, default=None, version=None):
+        if not self.is_local(key):
+            return self.shared.get(key, default, version)
+
+        value = self.local.get(key, self, version)
+        if value is self:
+            value = self.shared.get(key, self, version)
+            if value is self:
+                return default
+            self.local.set(key, value, version=version)
+
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = {}
+        missing = []
+
+        for key in keys:
+            value = self.local.get(key, self, version) if self.is_local(key) else self
+            if value is self:
+                missing.append(key)
+            else:
+                values[key] = value
+
+        if missing:
+            shared_values = self.shared.get_many(missing, version)
+            for key, value in shared_values.items():
+                if self.is_local(key):
+                    self.local.set(key, value, version=version)
+            values.update(shared_values)
+
+        return values
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        if self.is_local(key):
+            self.local.set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version)
+        self.local.set_many(
+            {key: value for (key, value) in data.items() if self.is_local(key)},
+            timeout,
+            version,
+        )
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        if added and self.is_local(key):
+            self.local.set(key, value, timeout, version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        if self.is_local(key):
+            self.local.touch(key, timeout, version)
+        return self.shared.touch(key, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        return self.shared.incr(key, delta, version)
+
+    def delete(self, key, version=None):
+        self.local.delete(key, version)
+        return self.shared.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.local.delete_many(keys, version)
+        self.shared.delete_many(keys, version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
@@ -0,0 +1,84 @@
+import json
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+class JSONEncoder(object):
+    """
+    Encodes documents with the standard library `json` module.
+
+    Documents which are neither a dictionary nor a list are treated as an
+    iterable of items, these are encoded as an array one item at a time when
+    streaming.
+    """
+
+    item_separator = ', '
+
+    def dumps(self, document):
+        return json.dumps(document)
+
+    def encode(self, document):
+        if not isinstance(document, (dict, list)):
+            document = list(document)
+
+        return self.dumps(document)
+
+    def iterencode(self, document):
+        if isinstance(document, (dict, list)):
+            yield self.dumps(document)
+            return
+
+        yield '['
+
+        for index, item in enumerate(document):
+            if index:
+                yield self.item_separator
+            yield self.dumps(item)
+
+        yield ']'
+
+
+class OrJSONEncoder(JSONEncoder):
+    item_separator = ','
+
+    def __init__(self):
+        import orjson
+
+        self.dumps = orjson.dumps
+
+
+class UJSONEncoder(JSONEncoder):
+    item_separator = ','
+
+    def __init__(self):
+        import ujson
+
+        self.ujson = ujson
+
+    def dumps(self, document):
+        return self.ujson.dumps(document, escape_forward_slashes=False)
+
+
+ENCODERS = {
+    'json': JSONEncoder,
+    'orjson': OrJSONEncoder,
+    'ujson': UJSONEncoder,
+}
+
+
+def get_encoder(name):
+    try:
+        encoder_class = ENCODERS[name]
+    except KeyError:
+        raise ImproperlyConfigured(
+            'Unknown JSON encoder {}, must be one of {}'.format(
+                name, ', '.join(sorted(ENCODERS))
+            )
+        )
+
+    try:
+        return encoder_class()
+    except ImportError:
+        raise ImproperlyConfigured(
+            'The {0} JSON encoder requires the {0} package'.format(name)
+        )
@@ -1,27 +1,194 @@
+import hashlib
 import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
 
-from polls.settings import CAN_CREATE_QUESTION, CAN_DELETE_QUESTION, CAN_VOTE_QUESTION
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
 
-with open('polls/fixtures/initial_data.json') as fp:
-    initial_data = json.load(fp)
-initial_questions = filter(lambda m: m['model'] == 'polls.question', initial_data)
-initial_question_pks = map(lambda m: m['pk'], initial_questions)
+from polls.models import Feature
+from polls.settings import get_env
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_initial_question_pks():
+    """
+    Returns the primary keys of the questions in the initial data, these
+    questions may never be deleted.
+    """
+
+    path = os.path.join(settings.BASE_DIR, 'polls', 'fixtures', 'initial_data.json')
+    with open(path) as fp:
+        initial_data = json.load(fp)
+
+    return frozenset(m['pk'] for m in initial_data if m['model'] == 'polls.question')
+
+
+class SettingsBackend(object):
+    """
+    Reads feature flags from the `FEATURES` setting.
+    """
+
+    def load(self):
+        return dict(settings.FEATURES)
+
+
+class EnvironmentBackend(object):
+    """
+    Reads feature flags from the environment, for example `question.create`
+    from `POLLS_FEATURE_QUESTION_CREATE`.
+    """
+
+    prefix = 'POLLS_FEATURE_'
+
+    def load(self):
+        return {
+            key[len(self.prefix) :].lower().replace('_', '.'): get_env(key)
+            for key in os.environ
+            if key.startswith(self.prefix)
+        }
+
+
+class DatabaseBackend(object):
+    """
+    Reads feature flags from the `Feature` table.
+    """
+
+    def load(self):
+        return dict(Feature.objects.values_list('key', 'enabled'))
+
+
+BACKENDS = {
+    'settings': SettingsBackend,
+    'env': EnvironmentBackend,
+    'database': DatabaseBackend,
+}
+
+
+def get_backend(name):
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ImproperlyConfigured(
+            'Unknown feature backend {}, must be one of {}'.format(
+                name, ', '.join(sorted(BACKENDS))
+            )
+        )
+
+
+class FeatureFlags(object):
+    """
+    Holds the feature flags loaded from `backend`. After the first use they
+    are reloaded every `interval` seconds in a background thread, requests
+    keep reading the previous flags and never wait for a reload.
+
+    `generation` is a digest of the flags, the versions of resources whose
+    actions depend on them include it. It is the same in every process which
+    loaded the same flags.
+    """
+
+    def __init__(self, backend, interval=None):
+        self.backend = backend
+        self.interval = interval
+        self.flags = None
+        self.generation = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def get(self, key, default=False):
+        flags = self.flags
+        if flags is None:
+            flags = self.load()
+
+        return flags.get(key, default)
+
+    def load(self):
+        with self.lock:
+            if self.flags is None:
+                try:
+                    self.reload()
+                except Exception:
+                    logger.exception('Failed to load feature flags')
+                    self.set_flags({})
+
+                self.start()
+
+            return self.flags
+
+    def get_generation(self):
+        if self.flags is None:
+            self.load()
+
+        return self.generation
+
+    def reload(self):
+        self.set_flags(self.backend.load())
+
+    def set_flags(self, flags):
+        value = json.dumps(flags, sort_keys=True)
+        self.generation = hashlib.md5(value.encode('utf-8')).hexdigest()
+        self.flags = flags
+
+    def start(self):
+        if not self.interval or self.thread is not None:
+            return
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            close_old_connections()
+
+            try:
+                self.reload()
+            except Exception:
+                logger.exception('Failed to reload feature flags')
+
+
+feature_flags = FeatureFlags(
+    get_backend(settings.FEATURE_BACKEND), settings.FEATURE_RELOAD_INTERVAL
+)
 
 
 def is_feature_enabled(feature_key, request, default=False):
-    return default
+    """
+    Decisions are cached on the request, a request therefore sees the same
+    flags throughout even when they are reloaded meanwhile. Without a request,
+    such as in management commands, the current flags are used.
+    """
+
+    if request is None:
+        return feature_flags.get(feature_key, default)
+
+    try:
+        decisions = request.features
+    except AttributeError:
+        decisions = request.features = {}
+
+    if feature_key not in decisions:
+        decisions[feature_key] = feature_flags.get(feature_key, default)
+
+    return decisions[feature_key]
 
 
 def can_create_question(request):
-    return is_feature_enabled('question.create', request, CAN_CREATE_QUESTION)
+    return is_feature_enabled('question.create', request, settings.CAN_CREATE_QUESTION)
 
 
 def can_delete_question(question, request):
-    if question.pk in initial_question_pks:
+    if question.pk in get_initial_question_pks():
         return False
 
-    return is_feature_enabled('question.delete', request, CAN_DELETE_QUESTION)
+    return is_feature_enabled('question.delete', request, settings.CAN_DELETE_QUESTION)
 
 
 def can_vote_choice(request):
-    return is_feature_enabled('choice.vote', request, CAN_VOTE_QUESTION)
+    return is_feature_enabled('choice.vote', request, settings.CAN_VOTE_QUESTION)
@@ -0,0 +1,43 @@
+import uuid
+
+from django.core.cache import cache
+
+QUESTIONS = 'polls:generation:questions'
+
+
+def question_key(pk):
+    return 'polls:generation:question:{}'.format(pk)
+
+
+def get_generations(keys):
+    """
+    Returns the generation of each of the cache keys. A generation is a token
+    replaced whenever the data it covers changes, responses cached under it
+    are then no longer found. Generations which are missing, because they were
+    never set or were evicted, start with a new token.
+    """
+
+    keys = list(keys)
+    generations = cache.get_many(keys) if keys else {}
+
+    for key in keys:
+        if key not in generations:
+            token = uuid.uuid4().hex
+            if not cache.add(key, token, None):
+                token = cache.get(key, token)
+            generations[key] = token
+
+    return [generations[key] for key in keys]
+
+
+def bump_generations(keys):
+    cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+
+def invalidate_questions(*pks):
+    """
+    Invalidates the cached responses of the questions, and of the question
+    collection which embeds them.
+    """
+
+    bump_generations([QUESTIONS] + [question_key(pk) for pk in pks])
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+
+class DatabaseProbe(object):
+    """
+    Checks whether a database is accessible at most once every `interval`
+    seconds, health checks in between are answered with the result of the
+    previous check. Checks made while another thread is checking wait for
+    its result rather than checking again.
+    """
+
+    def __init__(self, alias, interval):
+        self.alias = alias
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.result = None
+        self.checked_at = None
+
+    def check(self):
+        """
+        Returns a dictionary with whether the database is `accessible`, the
+        `duration` of the check in seconds and the `time` it was made.
+        """
+
+        if self.is_fresh():
+            return self.result
+
+        with self.lock:
+            if not self.is_fresh():
+                self.result = self.probe()
+                self.checked_at = time.monotonic()
+
+            return self.result
+
+    def is_fresh(self):
+        return (
+            self.checked_at is not None
+            and time.monotonic() - self.checked_at < self.interval
+        )
+
+    def invalidate(self):
+        self.checked_at = None
+
+    def probe(self):
+        started = time.perf_counter()
+
+        try:
+            with connections[self.alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            accessible = True
+        except ImproperlyConfigured:
+            # Database is not configured (DATABASE_URL may not be set)
+            accessible = False
+        except DatabaseError:
+            # Database is not accessible
+            accessible = False
+
+        return {
+            'accessible': accessible,
+            'duration': time.perf_counter() - started,
+            'time': timezone.now(),
+        }
+
+
+def get_pool_stats(alias):
+    """
+    Returns the size of the connection pool of a database, the connections in
+    use and the requests waiting for a connection, or `None` when its
+    connections are not pooled.
+    """
+
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is None:
+        return None
+
+    return pool.get_stats()
+
+
+database_probe = DatabaseProbe('default', settings.HEALTHCHECK_INTERVAL)
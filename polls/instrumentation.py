@@ -0,0 +1,271 @@
+"""
+Per-request instrumentation, enabled by the `INSTRUMENTATION` setting. Each
+request records its database queries, the time spent in each phase of
+rendering a resource and the size of its response. These are returned in a
+`Server-Timing` header, logged as a JSON line and aggregated into metrics
+served at `/metrics` in the Prometheus text format.
+
+When disabled the middleware is removed from the stack, and the hooks in the
+resources only check for the absent `request.timings`.
+"""
+
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager, nullcontext
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+not_timed = nullcontext()
+
+
+class Timings(object):
+    """
+    The queries and phase timings of a request. Phases are recorded in the
+    order they first ran, a phase which runs more than once is accumulated.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.queries = 0
+        self.query_time = 0.0
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_time += time.perf_counter() - started
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def get_server_timing(self, duration):
+        metrics = [
+            '{};dur={:.2f}'.format(name, elapsed * 1000)
+            for (name, elapsed) in self.phases.items()
+        ]
+        metrics.append(
+            'db;dur={:.2f};desc="{} queries"'.format(
+                self.query_time * 1000, self.queries
+            )
+        )
+        metrics.append('total;dur={:.2f}'.format(duration * 1000))
+        return ', '.join(metrics)
+
+
+def phase(request, name):
+    """
+    Returns a context manager timing a phase of handling `request`, which does
+    nothing unless the request is instrumented.
+    """
+
+    timings = getattr(request, 'timings', None)
+    if timings is None:
+        return not_timed
+
+    return timings.phase(name)
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics(object):
+    """
+    Counters and a request duration histogram of the requests handled by this
+    process, labelled by method and route. Every process has metrics of its
+    own, each worker must therefore be scraped.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.requests = Counter()
+            self.durations = {}
+            self.duration_sums = Counter()
+            self.queries = Counter()
+            self.query_seconds = Counter()
+            self.response_bytes = Counter()
+            self.phase_seconds = Counter()
+
+    def observe(self, method, route, status, duration, timings, size):
+        key = (method, route)
+        bucket = bisect.bisect_left(self.buckets, duration)
+
+        with self.lock:
+            self.requests[key + (str(status),)] += 1
+            if key not in self.durations:
+                self.durations[key] = [0] * (len(self.buckets) + 1)
+            self.durations[key][bucket] += 1
+            self.duration_sums[key] += duration
+            self.queries[key] += timings.queries
+            self.query_seconds[key] += timings.query_time
+            if size is not None:
+                self.response_bytes[key] += size
+            for name, elapsed in timings.phases.items():
+                self.phase_seconds[key + (name,)] += elapsed
+
+    def render(self):
+        lines = []
+
+        def family(name, kind, description, samples, labels):
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for values, value in sorted(samples.items()):
+                lines.append(sample(name, labels, values, value))
+
+        def sample(name, labels, values, value):
+            pairs = ','.join(
+                '{}="{}"'.format(label, escape_label(value))
+                for (label, value) in zip(labels, values)
+            )
+            return '{}{{{}}} {}'.format(name, pairs, value)
+
+        with self.lock:
+            family(
+                'polls_requests_total',
+                'counter',
+                'Requests handled.',
+                self.requests,
+                ('method', 'route', 'status'),
+            )
+
+            name = 'polls_request_duration_seconds'
+            lines.append('# HELP {} Time spent handling requests.'.format(name))
+            lines.append('# TYPE {} histogram'.format(name))
+            for key, counts in sorted(self.durations.items()):
+                total = 0
+                bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+                for bound, count in zip(bounds, counts):
+                    total += count
+                    lines.append(
+                        sample(
+                            name + '_bucket',
+                            ('method', 'route', 'le'),
+                            key + (bound,),
+                            total,
+                        )
+                    )
+                labels = ('method', 'route')
+                lines.append(
+                    sample(name + '_sum', labels, key, self.duration_sums[key])
+                )
+                lines.append(sample(name + '_count', labels, key, total))
+
+            family(
+                'polls_db_queries_total',
+                'counter',
+                'Database queries made by requests.',
+                self.queries,
+                ('method', 'route'),
+            )
+            family(
+                'polls_db_query_seconds_total',
+                'counter',
+                'Time spent by requests in database queries.',
+                self.query_seconds,
+                ('method', 'route'),
+            )
+            family(
+                'polls_response_bytes_total',
+                'counter',
+                'Size of the bodies of responses which are not streamed.',
+                self.response_bytes,
+                ('method', 'route'),
+            )
+            family(
+                'polls_phase_seconds_total',
+                'counter',
+                'Time spent by requests in each phase of rendering a resource.',
+                self.phase_seconds,
+                ('method', 'route', 'phase'),
+            )
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def metrics_view(request):
+    return HttpResponse(
+        metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+class InstrumentationMiddleware(object):
+    """
+    Instruments every request, see the module documentation. Queries are
+    counted on the connections of the thread handling the request, queries
+    made concurrently in other threads are not counted. Streamed responses
+    are rendered after the middleware returns, so their serialization, size
+    and queries are not recorded.
+    """
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION:
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = request.timings = Timings()
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings.execute))
+            response = self.get_response(request)
+
+        duration = time.perf_counter() - timings.started
+        size = None if response.streaming else len(response.content)
+        match = request.resolver_match
+        route = match.route if match is not None else ''
+
+        response['Server-Timing'] = timings.get_server_timing(duration)
+        metrics.observe(
+            request.method, route, response.status_code, duration, timings, size
+        )
+        logger.info(
+            json.dumps(
+                {
+                    'method': request.method,
+                    'path': request.path,
+                    'route': route,
+                    'status': response.status_code,
+                    'duration_ms': round(duration * 1000, 2),
+                    'queries': timings.queries,
+                    'query_ms': round(timings.query_time * 1000, 2),
+                    'bytes': size,
+                    'phases': {
+                        name: round(elapsed * 1000, 2)
+                        for (name, elapsed) in timings.phases.items()
+                    },
+                }
+            )
+        )
+
+        return response
@@ -1,32 +1,130 @@
-import json
+import time
 from datetime import timedelta
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
 
-from polls.models import Question, Vote
+from polls.features import get_initial_question_pks
+from polls.generations import invalidate_questions
+from polls.models import Choice, Question, Vote
+from polls.resource import keyset_filter
+from polls.views import QuestionCollectionResource
 
 
 class Command(BaseCommand):
     help = 'Removes questions older than an hour except initial data'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows to remove in each transaction',
+        )
+        parser.add_argument(
+            '--age',
+            type=int,
+            default=60,
+            help='Minutes after which a question is removed',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help='Seconds to wait between batches',
+        )
+
     def handle(self, *args, **kwargs):
-        with open('polls/fixtures/initial_data.json') as fp:
-            initial_data = json.load(fp)
+        self.batch_size = kwargs['batch_size']
+        self.sleep = kwargs['sleep']
+
+        self.run_batches(
+            'Deleted',
+            'questions',
+            self.get_expired_questions(kwargs['age']),
+            ('published_at', 'id'),
+            self.delete_questions,
+        )
+        QuestionCollectionResource.count_provider.invalidate()
+        invalidate_questions()
 
-        initial_questions = filter(
-            lambda m: m['model'] == 'polls.question', initial_data
+        self.run_batches(
+            'Deleted', 'votes', Vote.objects.all(), ('id',), self.delete_votes
+        )
+        self.run_batches(
+            'Reset',
+            'choices',
+            Choice.objects.filter(vote_count__gt=0),
+            ('id',),
+            self.reset_choices,
         )
-        initial_question_pks = map(lambda m: m['pk'], initial_questions)
-        one_hour_ago = timezone.now() - timedelta(hours=1)
-        qs = Question.objects.exclude(id__in=initial_question_pks).filter(
-            published_at__lt=one_hour_ago
+
+    def get_expired_questions(self, age):
+        cutoff = timezone.now() - timedelta(minutes=age)
+        return Question.objects.exclude(id__in=get_initial_question_pks()).filter(
+            published_at__lt=cutoff
         )
 
-        print('Deleting {} questions'.format(qs.count()))
-        qs.delete()
+    def run_batches(self, verb, name, qs, fields, process):
+        """
+        Walks `qs` in keyset order on `fields`, which must end with the
+        primary key, and passes the primary keys of each batch to `process`
+        in a transaction of its own so locks are only held briefly.
+        """
+
+        started = time.monotonic()
+        total = 0
+        last = None
+
+        while True:
+            rows = list(self.get_batch(qs, fields, last))
+            if not rows:
+                break
+
+            with transaction.atomic():
+                process([row[-1] for row in rows])
+
+            total += len(rows)
+            last = rows[-1]
+            elapsed = time.monotonic() - started
+            print(
+                '{} {} {} ({} total, {:.0f}/s)'.format(
+                    verb, len(rows), name, total, total / elapsed if elapsed else 0
+                )
+            )
+
+            if len(rows) < self.batch_size:
+                break
+
+            time.sleep(self.sleep)
+
+        elapsed = time.monotonic() - started
+        print('{} {} {} in {:.2f}s'.format(verb, total, name, elapsed))
+        return total
+
+    def get_batch(self, qs, fields, last):
+        """
+        Returns the values of `fields` for the batch of `qs` after the values
+        `last`, or the first batch when `last` is None.
+        """
+
+        batch = qs.order_by(*fields)
+        if last is not None:
+            batch = batch.filter(keyset_filter(fields, last, 'gt'))
+
+        return batch.values_list(*fields)[: self.batch_size]
+
+    def delete_questions(self, pks):
+        # The cascade only loads the questions and choices of the batch, their
+        # votes are deleted in one statement as nothing depends on them
+        Question.objects.filter(pk__in=pks).delete()
 
-        qs = Vote.objects.all()
+    def delete_votes(self, pks):
+        Vote.objects.filter(pk__in=pks).delete()
 
-        print('Deleting {} votes'.format(qs.count()))
-        qs.delete()
+    def reset_choices(self, pks):
+        choices = Choice.objects.filter(pk__in=pks)
+        question_pks = set(choices.values_list('question_id', flat=True))
+        choices.update(vote_count=0, modified_at=timezone.now())
+        invalidate_questions(*question_pks)
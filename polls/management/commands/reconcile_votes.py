@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from polls.generations import invalidate_questions
+from polls.models import Choice, Vote
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the vote counter of every choice from the stored votes'
+
+    def handle(self, *args, **kwargs):
+        votes = (
+            Vote.objects.filter(choice=OuterRef('pk'))
+            .order_by()
+            .values('choice')
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+        actual_count = Coalesce(Subquery(votes), 0)
+
+        with transaction.atomic():
+            qs = Choice.objects.annotate(actual_count=actual_count).exclude(
+                vote_count=F('actual_count')
+            )
+
+            question_pks = set(qs.values_list('question_id', flat=True))
+            print('Reconciling {} choices'.format(qs.count()))
+            Choice.objects.filter(pk__in=qs.values('pk')).update(
+                vote_count=actual_count, modified_at=timezone.now()
+            )
+
+        if question_pks:
+            invalidate_questions(*question_pks)
@@ -0,0 +1,52 @@
+import hashlib
+import json
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalize_text(text):
+    text = unicodedata.normalize('NFC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def fingerprint(question_text, choice_texts):
+    content = [normalize_text(question_text)] + sorted(
+        map(normalize_text, choice_texts)
+    )
+    return hashlib.sha256(json.dumps(content).encode('utf-8')).hexdigest()
+
+
+def backfill_fingerprint(apps, schema_editor):
+    Question = apps.get_model('polls', 'Question')
+    seen = set()
+
+    # Questions which duplicate an older question keep a NULL fingerprint
+    for question in Question.objects.order_by('id').prefetch_related('choices'):
+        value = fingerprint(
+            question.question_text, [c.choice_text for c in question.choices.all()]
+        )
+
+        if value not in seen:
+            seen.add(value)
+            question.fingerprint = value
+            question.save(update_fields=['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0002_choice_vote_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='fingerprint',
+            field=models.CharField(
+                editable=False, max_length=64, null=True, unique=True
+            ),
+        ),
+        migrations.RunPython(backfill_fingerprint, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0003_question_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(
+                fields=['published_at', 'id'], name='question_published_at_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='choice',
+            index=models.Index(
+                fields=['question', '-vote_count', 'choice_text'],
+                name='choice_question_votes_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_feature'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -1,13 +1,46 @@
-from django.db import models
+import hashlib
+import json
+import re
+import unicodedata
+
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+def normalize_text(text):
+    text = unicodedata.normalize('NFC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def fingerprint(question_text, choice_texts):
+    """
+    Returns a digest of the normalized question text and its set of choices,
+    questions with the same fingerprint are duplicates of each other.
+    """
+
+    content = [normalize_text(question_text)] + sorted(
+        map(normalize_text, choice_texts)
+    )
+    return hashlib.sha256(json.dumps(content).encode('utf-8')).hexdigest()
 
 
 class Question(models.Model):
     question_text = models.CharField(max_length=140)
     published_at = models.DateTimeField(auto_now_add=True)
+    fingerprint = models.CharField(
+        max_length=64, unique=True, null=True, editable=False
+    )
 
     class Meta:
         get_latest_by = 'published_at'
         ordering = ('-published_at',)
+        indexes = [
+            # Serves the collection ordering, keyset pagination and cleanup
+            models.Index(
+                fields=['published_at', 'id'], name='question_published_at_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.question_text
@@ -18,16 +51,49 @@ class Choice(models.Model):
         Question, on_delete=models.CASCADE, related_name='choices'
     )
     choice_text = models.CharField(max_length=140)
+    vote_count = models.PositiveIntegerField(default=0)
+    # Updates of `vote_count` must set it too, it is the choice's
+    # Last-Modified
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Serves a question's choices in the order they are presented
+            models.Index(
+                fields=['question', '-vote_count', 'choice_text'],
+                name='choice_question_votes_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.choice_text
 
     def vote(self):
         """
-        Create a vote on this choice.
+        Create a vote on this choice and atomically increment its counter.
         """
-        return Vote.objects.create(choice=self)
+        with transaction.atomic():
+            vote = Vote.objects.create(choice=self)
+            Choice.objects.filter(pk=self.pk).update(
+                vote_count=F('vote_count') + 1, modified_at=timezone.now()
+            )
+
+        self.refresh_from_db(fields=['vote_count', 'modified_at'])
+        return vote
 
 
 class Vote(models.Model):
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE, related_name='votes')
+
+
+class Feature(models.Model):
+    """
+    Overrides the default of a feature flag, read by the `database` feature
+    backend.
+    """
+
+    key = models.CharField(max_length=100, unique=True)
+    enabled = models.BooleanField()
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Shares at most `max_size` connections between the threads of a process.
+    Connections are borrowed with `get` and given back with `put`, a thread
+    borrowing a connection while all of them are in use waits up to `timeout`
+    seconds for one to be given back.
+
+    Idle connections are reused most recently given back first, so that the
+    others stay idle and are closed once they have been idle for `max_idle`
+    seconds, keeping at least `min_size` of them open.
+    """
+
+    def __init__(self, min_size=1, max_size=10, timeout=10.0, max_idle=60.0):
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.condition = threading.Condition()
+        # Idle connections and the time they were given back, oldest first
+        self.idle = deque()
+        self.size = 0
+        self.waiting = 0
+
+    def get(self, connect):
+        """
+        Returns an idle connection, or a new connection opened by calling
+        `connect` while fewer than `max_size` connections are open. Raises
+        `PoolTimeout` when no connection is available in time.
+        """
+
+        deadline = time.monotonic() + self.timeout
+
+        with self.condition:
+            while not self.idle and self.size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        'No connection available within {} seconds, all {} '
+                        'connections are in use'.format(self.timeout, self.max_size)
+                    )
+
+                self.waiting += 1
+                try:
+                    self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+            if self.idle:
+                return self.idle.pop()[0]
+
+            self.size += 1
+
+        try:
+            return connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+
+    def put(self, connection, broken=False):
+        """
+        Gives a connection back, closing it when it is `broken`.
+        """
+
+        now = time.monotonic()
+        expired = [connection] if broken else []
+
+        with self.condition:
+            if not broken:
+                self.idle.append((connection, now))
+
+            while (
+                len(self.idle) > self.min_size
+                and now - self.idle[0][1] >= self.max_idle
+            ):
+                expired.append(self.idle.popleft()[0])
+
+            self.size -= len(expired)
+            self.condition.notify(len(expired) + (not broken))
+
+        for connection in expired:
+            try:
+                connection.close()
+            except Exception:
+                # A broken connection may fail to close, it is dropped anyway
+                pass
+
+    def close(self):
+        """
+        Closes the idle connections.
+        """
+
+        with self.condition:
+            idle = [connection for connection, _ in self.idle]
+            self.idle.clear()
+            self.size -= len(idle)
+            self.condition.notify(len(idle))
+
+        for connection in idle:
+            connection.close()
+
+    def get_stats(self):
+        """
+        Returns the number of open connections, those in use and the threads
+        waiting for a connection.
+        """
+
+        with self.condition:
+            return {
+                'size': self.size,
+                'max_size': self.max_size,
+                'in_use': self.size - len(self.idle),
+                'waiting': self.waiting,
+            }
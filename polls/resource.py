@@ -1,22 +1,82 @@
+import base64
+import binascii
+import hashlib
 import json
 from collections import namedtuple
+from functools import lru_cache, reduce
+from urllib.parse import urlencode
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.core.paginator import EmptyPage, Paginator
-from django.http import Http404, HttpResponse
-from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.functional import cached_property
+from django.utils.http import http_date, quote_etag
 from django.views.generic import View
 from mimeparse import MimeTypeParseException, best_match
 
+from polls.encoders import get_encoder
+from polls.generations import get_generations
+from polls.instrumentation import phase
+
 Attribute = namedtuple('Attribute', ('name', 'category'))
 Action = namedtuple('Action', ('method', 'attributes'))
 
+encoder = get_encoder(settings.JSON_ENCODER)
+
+
+CONTENT_TYPES = (
+    'application/vnd.siren+json',
+    'application/vnd.hal+json',
+    'application/hal+json',
+    'application/json',
+)
+
+
+@lru_cache(maxsize=256)
+def negotiate_content_type(accept):
+    """
+    Returns the best of `CONTENT_TYPES` for an Accept header. Clients send
+    few distinct headers, so decisions are cached for all resources.
+    """
+
+    try:
+        content_type = best_match(CONTENT_TYPES, accept)
+    except MimeTypeParseException:
+        content_type = None
+
+    return content_type or CONTENT_TYPES[-1]
+
+
+@lru_cache(maxsize=None)
+def allow_header(methods):
+    return ', '.join(('HEAD', 'GET') + methods)
+
 
 class SingleObjectMixin(object):
     model = None
 
+    def get_pk(self):
+        obj = getattr(self, 'obj', None)
+        if obj:
+            return obj.pk
+
+        return self.kwargs['pk']
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
     def get_object(self):
         if not getattr(self, 'obj', None):
-            self.obj = self.model.objects.get(pk=self.kwargs['pk'])
+            self.obj = self.get_queryset().get(pk=self.kwargs['pk'])
 
         return self.obj
 
@@ -25,6 +85,15 @@ class Resource(View):
     uri = None
     cache_max_age = None
 
+    # Number of seconds a rendered response is cached on the server. It is
+    # cached under the generations of the data it renders and stored with the
+    # resource's version, so it is never served once the resource changed
+    cache_timeout = None
+
+    # Whether `GET` and `HEAD` requests may read from a replica, see
+    # `polls.routers`
+    read_from_replica = True
+
     def get_attributes(self):
         return {}
 
@@ -51,7 +120,72 @@ class Resource(View):
     def get_uri(self):
         return self.uri
 
-    def content_handlers(self):
+    def get_cache_uri(self):
+        """
+        Returns the URI that identifies a rendered response in the cache.
+        """
+        return self.get_uri()
+
+    def get_last_modified(self):
+        """
+        Returns the time the resource was last modified, or `None` when it is
+        not known. It must change whenever the resource's attributes or
+        relations do.
+        """
+        return None
+
+    def get_state(self):
+        """
+        Returns a summary of the data the resource renders, which must change
+        whenever its representation does. It is computed for every request,
+        so it should cost at most a single aggregate query.
+        """
+        return None
+
+    def get_version(self, content_type):
+        """
+        Returns a digest of the state of the resource in the given content
+        type, it changes whenever the representation does, whichever process
+        made the change.
+        """
+
+        value = repr((self.get_cache_uri(), str(content_type), self.get_state()))
+        return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+    def get_generation_keys(self):
+        """
+        Returns the cache keys of the generations of the data the resource
+        renders, writes bump them to invalidate its cached responses. See
+        `polls.generations`.
+        """
+        return ()
+
+    def get_cache_key(self, content_type):
+        generations = get_generations(self.get_generation_keys())
+        value = repr((self.get_cache_uri(), str(content_type), generations))
+        return 'polls:response:{}'.format(
+            hashlib.md5(value.encode('utf-8')).hexdigest()
+        )
+
+    def memoize(self):
+        """
+        Caches the attributes, relations and actions of this resource so that
+        they are computed once while rendering a response, regardless of how
+        many times the serializer and headers ask for them. Serializers may
+        modify the attributes they are given, so each call returns a copy.
+        """
+
+        if getattr(self, 'memoized', False):
+            return
+
+        self.memoized = True
+        get_attributes = lru_cache(maxsize=None)(self.get_attributes)
+        self.get_attributes = lambda: dict(get_attributes())
+        self.get_relations = lru_cache(maxsize=None)(self.get_relations)
+        self.get_actions = lru_cache(maxsize=None)(self.get_actions)
+
+    @classmethod
+    def content_handlers(cls):
         return {
             'application/json': to_json,
             'application/hal+json': to_hal,
@@ -59,54 +193,213 @@ class Resource(View):
             'application/vnd.siren+json': to_siren,
         }
 
+    @classmethod
+    def get_content_handlers(cls):
+        """
+        Returns the `content_handlers` of the class, they are only built once
+        per class and must not be modified.
+        """
+
+        handlers = cls.__dict__.get('_content_handlers')
+        if handlers is None:
+            handlers = cls._content_handlers = cls.content_handlers()
+
+        return handlers
+
+    def get_link_template(self, relations):
+        """
+        Returns the relations which are linked rather than embedded, and a Link
+        header with a placeholder for each of their URIs. `can_embed` may only
+        depend on the relation, so these are built once per class for each
+        set of relations.
+        """
+
+        templates = type(self).__dict__.get('_link_templates')
+        if templates is None:
+            templates = type(self)._link_templates = {}
+
+        key = tuple(relations)
+        if key not in templates:
+            linked = tuple(r for r in key if not self.can_embed(r))
+            template = ', '.join('<{{}}>; rel="{}"'.format(r) for r in linked)
+            templates[key] = (linked, template)
+
+        return templates[key]
+
     def get(self, request, *args, **kwargs):
-        content_type = self.determine_content_type(request)
-        handlers = self.content_handlers()
-        handler = handlers[str(content_type)]
-        response = HttpResponse(json.dumps(handler(self)), content_type)
+        self.memoize()
+        with phase(request, 'negotiate'):
+            content_type = self.determine_content_type(request)
+        with phase(request, 'version'):
+            version = self.get_version(content_type)
+            last_modified = self.get_last_modified()
+        etag = quote_etag(version)
+        if last_modified is not None:
+            last_modified = int(last_modified.timestamp())
+        response = None
+
+        if request.method in ('GET', 'HEAD'):
+            response = get_conditional_response(request, etag, last_modified)
+
+        if response is None:
+            response = self.get_response(request, content_type, version)
+
         patch_vary_headers(response, ['Accept'])
         if self.cache_max_age is not None:
             patch_cache_control(response, max_age=self.cache_max_age)
 
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_response(self, request, content_type, version):
+        if self.cache_timeout is None or self.is_streamed(content_type):
+            return self.render(request, content_type)
+
+        with phase(request, 'cache'):
+            cache_key = self.get_cache_key(content_type)
+            cached = cache.get(cache_key)
+
+        # A response rendered before a change which did not bump a generation
+        # has another version, and is rendered again
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        response = self.render(request, content_type)
+        cache.set(cache_key, (version, response), self.cache_timeout)
+        return response
+
+    def is_streamed(self, content_type):
+        """
+        Returns whether the response is streamed as it is encoded, only the
+        arrays of collections rendered as plain JSON are.
+        """
+
+        return False
+
+    def render(self, request, content_type):
+        handler = self.get_content_handlers()[str(content_type)]
+
+        with phase(request, 'relations'):
+            self.get_relations()
+
+        # Collections rendered as plain JSON are serialized while encoding
+        with phase(request, 'serialize'):
+            document = handler(self)
+
+        if self.is_streamed(content_type):
+            content = encoder.iterencode(document)
+            response = StreamingHttpResponse(content, content_type=content_type)
+        else:
+            with phase(request, 'encode'):
+                content = encoder.encode(document)
+            response = HttpResponse(content, content_type)
+
         if str(content_type) == 'application/json':
             # Add a Link header
-            can_embed_relation = lambda relation: not self.can_embed(relation[0])
-            relations = filter(can_embed_relation, self.get_relations().items())
-            relation_to_link = lambda relation: '<{}>; rel="{}"'.format(
-                relation[1].get_uri(), relation[0]
-            )
-            links = list(map(relation_to_link, relations))
-            if len(links) > 0:
-                response['Link'] = ', '.join(links)
+            relations = self.get_relations()
+            linked, template = self.get_link_template(relations)
+            if linked:
+                response['Link'] = template.format(
+                    *[relations[relation].get_uri() for relation in linked]
+                )
 
         if str(content_type) != 'application/vnd.siren+json':
             # Add an Allow header
-            methods = ['HEAD', 'GET'] + list(
-                map(lambda a: a.method, self.get_actions().values())
-            )
-            response['allow'] = ', '.join(methods)
+            methods = [action.method for action in self.get_actions().values()]
+            response['Allow'] = allow_header(tuple(methods))
 
         return response
 
     def determine_content_type(self, request):
-        content_types = [
-            'application/vnd.siren+json',
-            'application/vnd.hal+json',
-            'application/hal+json',
-            'application/json',
-        ]
+        return negotiate_content_type(request.META.get('HTTP_ACCEPT', '*/*'))
 
-        accept = request.META.get('HTTP_ACCEPT', '*/*')
 
-        try:
-            content_type = best_match(content_types, accept)
-        except MimeTypeParseException:
-            content_type = None
+class ExactCount(object):
+    """
+    Counts a collection by running `COUNT(*)` on every request.
+    """
+
+    def count(self, queryset):
+        return queryset.count()
+
+    def invalidate(self):
+        pass
+
+
+class CachedCount(ExactCount):
+    """
+    Counts a collection once and serves the count from the cache until it is
+    invalidated or `timeout` seconds have passed.
+    """
 
-        if not content_type:
-            return content_types[-1]
+    def __init__(self, key, timeout=None):
+        self.key = key
+        self.timeout = timeout
 
-        return content_type
+    def count(self, queryset):
+        count = cache.get(self.key)
+
+        if count is None:
+            count = queryset.count()
+            cache.set(self.key, count, self.timeout)
+
+        return count
+
+    def invalidate(self):
+        cache.delete(self.key)
+
+
+class EstimatedCount(ExactCount):
+    """
+    Uses the PostgreSQL planner's row estimate for unfiltered collections
+    whose estimate is at least `threshold` rows, counting smaller or filtered
+    collections with `fallback`.
+    """
+
+    def __init__(self, threshold, fallback=None):
+        self.threshold = threshold
+        self.fallback = fallback or ExactCount()
+
+    def count(self, queryset):
+        estimate = self.estimate(queryset)
+
+        if estimate is not None and estimate >= self.threshold:
+            return estimate
+
+        return self.fallback.count(queryset)
+
+    def estimate(self, queryset):
+        connection = connections[queryset.db]
+
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            return None
+
+        return int(row[0])
+
+    def invalidate(self):
+        self.fallback.invalidate()
+
+
+class CountPaginator(Paginator):
+    def __init__(self, object_list, per_page, count_provider):
+        self.count_provider = count_provider
+        super(CountPaginator, self).__init__(object_list, per_page)
+
+    @cached_property
+    def count(self):
+        return self.count_provider.count(self.object_list)
 
 
 class CollectionResource(Resource):
@@ -115,20 +408,47 @@ class CollectionResource(Resource):
     relation = 'objects'
     paginate_by = 20
 
-    def __init__(self, page=None):
+    # Either `page` for page number pagination or `cursor` for keyset
+    # pagination over `cursor_ordering`. Cursor pagination avoids counting the
+    # collection and offsetting into it, requests with a `page` parameter are
+    # always paginated by page number. The cursor ordering must be unique and
+    # all fields must be sorted in the same direction.
+    pagination = 'page'
+    cursor_ordering = ('-id',)
+
+    # Provides the total count used for the `last` relation with page number
+    # pagination
+    count_provider = ExactCount()
+
+    def __init__(self, page=None, cursor=None):
         self.page = page
+        self.cursor = cursor
         super(CollectionResource, self).__init__()
 
     def get_uri(self):
         if self.page is not None:
             return '{}?page={}'.format(self.uri, self.page)
+        if self.cursor is not None:
+            return '{}?cursor={}'.format(self.uri, self.cursor)
+        return self.uri
+
+    def get_cache_uri(self):
+        # Only the pagination parameters are part of the representation,
+        # other parameters must not create cache entries of their own
+        params = [
+            (name, self.request.GET[name])
+            for name in ('page', 'cursor')
+            if name in self.request.GET
+        ]
+        if params:
+            return '{}?{}'.format(self.uri, urlencode(params))
         return self.uri
 
     def get_objects(self):
         return self.model.objects.all()
 
     def get_paginator(self):
-        return Paginator(self.get_objects(), self.paginate_by)
+        return CountPaginator(self.get_objects(), self.paginate_by, self.count_provider)
 
     def get_resources(self, objects):
         def to_resource(obj):
@@ -140,6 +460,12 @@ class CollectionResource(Resource):
         return list(map(to_resource, objects))
 
     def get_relations(self):
+        if self.pagination == 'cursor' and 'page' not in self.request.GET:
+            return self.get_cursor_relations()
+
+        return self.get_page_relations()
+
+    def get_page_relations(self):
         paginator = self.get_paginator()
 
         try:
@@ -152,6 +478,10 @@ class CollectionResource(Resource):
         except EmptyPage:
             raise Http404()
 
+        if page_number > 1 and not page.object_list:
+            # An estimated or cached count may exceed the collection
+            raise Http404()
+
         relations = {self.relation: self.get_resources(page)}
 
         relations['first'] = self.__class__()
@@ -167,138 +497,290 @@ class CollectionResource(Resource):
 
         return relations
 
-    def content_handlers(self):
+    def get_cursor_relations(self):
+        fields = [field.lstrip('-') for field in self.cursor_ordering]
+        direction, values = 'next', None
+
+        if 'cursor' in self.request.GET:
+            try:
+                direction, values = decode_cursor(self.request.GET['cursor'])
+                values = [
+                    self.model._meta.get_field(field).to_python(value)
+                    for (field, value) in zip(fields, values)
+                ]
+            except (TypeError, ValueError, ValidationError):
+                raise Http404()
+
+            if len(values) != len(fields):
+                raise Http404()
+
+        forward = direction == 'next'
+        objects = list(self.get_cursor_objects(direction, values))
+        has_more = len(objects) > self.paginate_by
+        objects = objects[: self.paginate_by]
+
+        if not forward:
+            objects.reverse()
+
+        relations = {self.relation: self.get_resources(objects)}
+
+        relations['first'] = self.__class__()
+
+        if objects and (has_more if forward else values is not None):
+            cursor = encode_cursor('next', objects[-1], fields)
+            relations['next'] = self.__class__(cursor=cursor)
+
+        if objects and (values is not None if forward else has_more):
+            cursor = encode_cursor('prev', objects[0], fields)
+            relations['prev'] = self.__class__(cursor=cursor)
+
+        return relations
+
+    def get_cursor_objects(self, direction, values):
+        """
+        Returns the objects of a page after the cursor `values` in
+        `direction`, with one more object to find out whether there are more
+        pages. The objects before the cursor are in reverse order.
+        """
+
+        fields = [field.lstrip('-') for field in self.cursor_ordering]
+        descending = self.cursor_ordering[0].startswith('-')
+        forward = direction == 'next'
+        objects = self.get_objects()
+
+        if values is not None:
+            lookup = 'lt' if descending == forward else 'gt'
+            objects = objects.filter(keyset_filter(fields, values, lookup))
+
+        if forward:
+            objects = objects.order_by(*self.cursor_ordering)
+        else:
+            objects = objects.order_by(*map(reverse_ordering, self.cursor_ordering))
+
+        return objects[: self.paginate_by + 1]
+
+    @classmethod
+    def content_handlers(cls):
         """
-        Override `content_handlers` to change JSON handler to return arrays
+        Override `content_handlers` to change JSON handler to return arrays,
+        the items are serialized lazily so that they may be streamed
         """
 
-        handlers = super(CollectionResource, self).content_handlers()
-        handlers['application/json'] = lambda resource: list(
-            map(to_json, self.get_relations()[self.relation])
+        handlers = super(CollectionResource, cls).content_handlers()
+        handlers['application/json'] = lambda resource: map(
+            to_json, resource.get_relations()[resource.relation]
         )
         return handlers
 
+    def is_streamed(self, content_type):
+        return settings.STREAM_RESPONSES and str(content_type) == 'application/json'
+
     def can_embed(self, relation):
         return relation not in ('next', 'prev', 'first', 'last')
 
 
-def to_json(resource):
-    document = resource.get_attributes()
-    document['url'] = resource.get_uri()
+def reverse_ordering(field):
+    if field.startswith('-'):
+        return field[1:]
+    return '-' + field
+
+
+def keyset_filter(fields, values, lookup):
+    """
+    Builds a filter for the rows sorting after `values` on `fields`, for
+    example `a <= x AND (a < x OR (a = x AND b < y))` with the `lt` lookup.
+    The redundant bound on the first field lets the database seek into an
+    index on `fields` instead of scanning it from the start.
+    """
+
+    def position(index):
+        exact = {field: value for (field, value) in zip(fields, values[:index])}
+        exact['{}__{}'.format(fields[index], lookup)] = values[index]
+        return Q(**exact)
+
+    bound = Q(**{'{}__{}e'.format(fields[0], lookup): values[0]})
+    return bound & reduce(
+        lambda q, index: q | position(index), range(1, len(fields)), position(0)
+    )
+
 
-    for relation, related_resource in resource.get_relations().items():
-        if isinstance(related_resource, list):
-            if resource.can_embed(relation):
-                document[relation] = list(map(to_json, related_resource))
+def encode_cursor(direction, obj, fields):
+    values = [obj._meta.get_field(field).value_to_string(obj) for field in fields]
+    payload = json.dumps([direction] + values).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns the direction and field values encoded in a cursor, raises
+    `ValueError` when the cursor is invalid.
+    """
+
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, *values = json.loads(payload.decode('utf-8'))
+    except (binascii.Error, TypeError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+    if direction not in ('next', 'prev'):
+        raise ValueError('Invalid cursor')
+
+    # Values are encoded as strings, fields may not parse anything else
+    if not all(isinstance(value, str) for value in values):
+        raise ValueError('Invalid cursor')
+
+    return (direction, values)
+
+
+def to_node(resource, actions=False):
+    """
+    Converts a resource into a format neutral node, a tuple of its URI,
+    attributes, relations and actions. Relations are produced lazily while
+    the node is being serialized as tuples of the relation name, whether the
+    relation may be embedded and either a node or a list of nodes. Nodes for
+    relations which are only linked to, including lists, carry just a URI.
+
+    Each embedded resource's `get_uri`, `get_attributes`, `get_relations`
+    and, when `actions` is set, `get_actions` are called exactly once. Only
+    `get_uri` is called on resources which are only linked to.
+    """
+
+    relations = resource.get_relations()
+
+    return (
+        resource.get_uri(),
+        resource.get_attributes(),
+        to_node_relations(resource, relations, actions) if relations else (),
+        resource.get_actions().items() if actions else (),
+    )
+
+
+def to_node_relations(resource, relations, actions):
+    for relation, related_resource in relations.items():
+        embed = resource.can_embed(relation)
+
+        if type(related_resource) is list:
+            if embed:
+                nodes = [to_node(r, actions) for r in related_resource]
             else:
-                document[relation] = list(
-                    map(lambda r: {'url': r.get_uri()}, related_resource)
-                )
+                nodes = [(r.get_uri(), None, (), ()) for r in related_resource]
+            yield (relation, embed, nodes)
+        elif embed:
+            yield (relation, embed, to_node(related_resource, actions))
         else:
-            if resource.can_embed(relation):
-                document[relation] = to_json(related_resource)
+            yield (relation, embed, (related_resource.get_uri(), None, (), ()))
+
+
+def node_to_json(node):
+    uri, document, relations, _ = node
+    document['url'] = uri
+
+    for relation, embed, related in relations:
+        if type(related) is list:
+            if embed:
+                document[relation] = [node_to_json(n) for n in related]
             else:
-                document['{}_url'.format(relation)] = related_resource.get_uri()
+                document[relation] = [{'url': n[0]} for n in related]
+        elif embed:
+            document[relation] = node_to_json(related)
+        else:
+            document['{}_url'.format(relation)] = related[0]
 
     return document
 
 
-def to_hal(resource):
-    document = resource.get_attributes()
-    relations = resource.get_relations()
+def node_to_hal(node):
+    uri, document, relations, _ = node
 
     embed = {}
     links = {}
 
-    for relation in relations:
-        related_resource = relations[relation]
-
-        if resource.can_embed(relation) or isinstance(related_resource, list):
-            if isinstance(related_resource, list):
-                embed[relation] = list(map(to_hal, related_resource))
+    for relation, can_embed, related in relations:
+        if type(related) is list:
+            if can_embed:
+                embed[relation] = [node_to_hal(n) for n in related]
             else:
-                embed[relation] = to_hal(related_resource)
+                links[relation] = [{'href': n[0]} for n in related]
+        elif can_embed:
+            embed[relation] = node_to_hal(related)
         else:
-            href = related_resource.get_uri()
-            links[relation] = {'href': href}
+            links[relation] = {'href': related[0]}
 
-    links['self'] = {'href': resource.get_uri()}
+    links['self'] = {'href': uri}
 
     document['_links'] = links
-    if len(embed):
+    if embed:
         document['_embed'] = embed
 
     return document
 
 
-def to_siren_relation(relation):
-    def inner(resource):
-        document = to_siren(resource)
-        document['rel'] = [relation]
-        return document
-
-    return inner
-
-
-def to_siren(resource):
-    def to_siren_link(relation):
-        def inner(resource):
-            return {'rel': [relation], 'href': resource.get_uri()}
-
-        return inner
-
+def node_to_siren(node, rel=None):
+    uri, attributes, relations, node_actions = node
     document = {}
 
-    attributes = resource.get_attributes()
-    if len(attributes):
+    if attributes:
         document['properties'] = attributes
 
     links = []
     entities = []
-    for relation, related_resource in resource.get_relations().items():
-        if resource.can_embed(relation):
-            if isinstance(related_resource, list):
-                entities += list(map(to_siren_relation(relation), related_resource))
+    for relation, embed, related in relations:
+        rels = [relation]
+
+        if type(related) is list:
+            if embed:
+                entities += [node_to_siren(n, rels) for n in related]
             else:
-                entity = to_siren_relation(relation)(related_resource)
-                entities.append(entity)
+                links += [{'rel': rels, 'href': n[0]} for n in related]
+        elif embed:
+            entities.append(node_to_siren(related, rels))
         else:
-            if isinstance(related_resource, list):
-                items = list(map(to_siren_link(relation), related_resource))
-                links += items
-            else:
-                links.append(to_siren_link(relation)(related_resource))
+            links.append({'rel': rels, 'href': related[0]})
 
-    links.append(to_siren_link('self')(resource))
+    links.append({'rel': ['self'], 'href': uri})
     document['links'] = links
 
-    if len(entities):
+    if entities:
         document['entities'] = entities
 
     actions = []
 
-    for name, action in resource.get_actions().items():
+    for name, action in node_actions:
         action_dict = {
             'name': name,
             'method': action.method,
-            'href': resource.get_uri(),
+            'href': uri,
             'type': 'application/json',
         }
 
         if action.attributes:
-
-            def to_field(attribute):
-                return {
+            action_dict['fields'] = [
+                {
                     'name': attribute.name,
                     'type': attribute.category,
                     'title': attribute.name.capitalize(),
                 }
-
-            action_dict['fields'] = list(map(to_field, action.attributes))
+                for attribute in action.attributes
+            ]
 
         actions.append(action_dict)
 
-    if len(actions):
+    if actions:
         document['actions'] = actions
 
+    if rel is not None:
+        document['rel'] = rel
+
     return document
+
+
+def to_json(resource):
+    return node_to_json(to_node(resource))
+
+
+def to_hal(resource):
+    return node_to_hal(to_node(resource))
+
+
+def to_siren(resource):
+    return node_to_siren(to_node(resource, actions=True))
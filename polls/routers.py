@@ -0,0 +1,90 @@
+"""
+Routes the queries of `GET` and `HEAD` requests to the resources to one of the
+read replicas in `DATABASE_REPLICAS`, every other query is made on the primary
+database. This includes the writes, the queries of other views and of the
+management commands and background threads.
+
+Replicas lag behind the primary, a client which successfully wrote is
+therefore pinned to the primary for `REPLICA_STICKINESS` seconds so that it
+reads its own writes. Clients are pinned in the cache, and are therefore only
+pinned in other processes when the cache is shared between them.
+
+A response rendered from a replica which lags behind has the version of the
+state it was rendered from, its ETag and the key it is cached by therefore
+never stand in for those of the current state.
+"""
+
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+
+from polls.throttling import get_client
+
+# The replica the current request reads from
+read_database = ContextVar('read_database', default=None)
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
+
+
+def get_sticky_key(request):
+    return 'polls:sticky:{}'.format(get_client(request))
+
+
+def pin_to_primary(request):
+    if settings.REPLICA_STICKINESS:
+        cache.set(get_sticky_key(request), True, settings.REPLICA_STICKINESS)
+
+
+def is_pinned_to_primary(request):
+    return cache.get(get_sticky_key(request), False)
+
+
+class ReplicaMiddleware(object):
+    """
+    Chooses a replica for requests to views with `read_from_replica` set,
+    pinning clients to the primary after a successful write.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            # Threads keep their context between requests
+            read_database.set(None)
+
+        if request.method not in ('GET', 'HEAD') and response.status_code < 400:
+            pin_to_primary(request)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+
+        if (
+            request.method in ('GET', 'HEAD')
+            and getattr(view_class, 'read_from_replica', False)
+            and not is_pinned_to_primary(request)
+        ):
+            read_database.set(random.choice(settings.DATABASE_REPLICAS))
@@ -14,6 +14,8 @@ import os
 
 import dj_database_url
 
+from polls.caches import parse_cache_url
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -43,11 +45,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'django.middleware.cache.UpdateCacheMiddleware',
+    'polls.instrumentation.InstrumentationMiddleware',
+    'polls.routers.ReplicaMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
 ]
 
@@ -77,6 +79,19 @@ DATABASES = {
     'default': dj_database_url.config(conn_max_age=500),
 }
 
+# Read replicas, as a comma separated list of database URLs in
+# `DATABASE_REPLICA_URLS`. Resources are read from a replica, see
+# `polls.routers`.
+DATABASE_REPLICAS = []
+
+for url in filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')):
+    alias = 'replica{}'.format(len(DATABASE_REPLICAS) + 1)
+    DATABASES[alias] = dj_database_url.parse(url.strip(), conn_max_age=500)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['polls.routers.ReplicaRouter']
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
@@ -98,18 +113,6 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 
-# Cache
-
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'pollsapi',
-    }
-}
-
-CACHE_MIDDLEWARE_SECONDS = 10
-
-
 def get_env(key, default=True):
     value = os.environ.get(key, default)
     return (
@@ -120,6 +123,74 @@ def get_env(key, default=True):
     )
 
 
+def get_env_number(key, default, cast=int):
+    return cast(os.environ.get(key, default))
+
+
+# Database connection pool
+
+# Share a pool of at most `DATABASE_POOL_MAX_SIZE` connections to each
+# PostgreSQL database between the threads of a process instead of keeping a
+# connection open for each thread, see `polls.backends.postgresql`. Idle
+# connections are closed after a minute, keeping `DATABASE_POOL_MIN_SIZE`
+# open. Requests wait up to `DATABASE_POOL_TIMEOUT` seconds for a connection.
+# A maximum size of 0 disables the pool.
+DATABASE_POOL_MIN_SIZE = get_env_number('POLLS_DATABASE_POOL_MIN_SIZE', 1)
+DATABASE_POOL_MAX_SIZE = get_env_number('POLLS_DATABASE_POOL_MAX_SIZE', 0)
+DATABASE_POOL_TIMEOUT = get_env_number('POLLS_DATABASE_POOL_TIMEOUT', 10.0, float)
+
+if DATABASE_POOL_MAX_SIZE:
+    for database in DATABASES.values():
+        if 'postgresql' in database.get('ENGINE', ''):
+            database['ENGINE'] = 'polls.backends.postgresql'
+            # Connections are given back to the pool at the end of requests
+            database['CONN_MAX_AGE'] = 0
+
+
+# Health checks
+
+# Number of seconds the result of checking that the database is accessible is
+# reused by health checks
+HEALTHCHECK_INTERVAL = get_env_number('POLLS_HEALTHCHECK_INTERVAL', 5.0, float)
+
+
+# Cache
+
+# The cache is configured by the `CACHE_URL` environment variable, such as
+# `memcached://localhost:11211`, see `polls.caches.parse_cache_url`. Memcached
+# requires the `python-memcached` package. By default each process has a
+# cache of its own.
+CACHES = {
+    'default': parse_cache_url(os.environ.get('CACHE_URL', 'locmem://pollsapi')),
+}
+
+# Number of seconds clients may cache a question or choice for
+RESPONSE_MAX_AGE = 10
+
+# Number of seconds rendered responses are cached on the server. Responses
+# are cached by the version of the resource, which is derived from the
+# database on every request, so a changed resource is never served from the
+# cache whichever process changed it.
+RESPONSE_CACHE_TIMEOUT = get_env_number('POLLS_RESPONSE_CACHE_TIMEOUT', 10)
+
+# Number of rendered responses kept in each process in front of the cache
+# configured by `CACHE_URL`, so that the most requested responses are served
+# without a request to a shared cache. 0 disables the local cache.
+LOCAL_CACHE_SIZE = get_env_number('POLLS_LOCAL_CACHE_SIZE', 0)
+
+if LOCAL_CACHE_SIZE:
+    CACHES['shared'] = CACHES['default']
+    CACHES['default'] = {
+        'BACKEND': 'polls.caches.TieredCache',
+        'LOCATION': 'shared',
+        'TIMEOUT': RESPONSE_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': LOCAL_CACHE_SIZE},
+    }
+
+# Number of seconds the total count of questions is cached for
+COUNT_CACHE_TIMEOUT = 60
+
+
 # Security Middleware
 if not DEBUG:
     SECURE_SSL_REDIRECT = get_env('SECURE_SSL_REDIRECT')
@@ -136,9 +207,89 @@ CAN_DELETE_QUESTION = get_env('POLLS_CAN_DELETE_QUESTION')
 # Enables the ability to vote on a question
 CAN_VOTE_QUESTION = get_env('POLLS_CAN_VOTE_QUESTION')
 
+# Where feature flags overriding the settings above are read from, either
+# `settings` (the `FEATURES` setting), `env` (`POLLS_FEATURE_*` variables) or
+# `database` (the `Feature` table)
+FEATURE_BACKEND = os.environ.get('POLLS_FEATURE_BACKEND', 'settings')
+
+# Feature flags by key, for example `{'question.create': False}`
+FEATURES = {}
+
+# Number of seconds between reloading the feature flags in the background
+FEATURE_RELOAD_INTERVAL = get_env_number('POLLS_FEATURE_RELOAD_INTERVAL', 30.0, float)
+
+# Buffer votes in memory and write them in batches of this size, a size of 1
+# writes every vote immediately. Buffered votes are lost if the process dies.
+VOTE_BUFFER_SIZE = get_env_number('POLLS_VOTE_BUFFER_SIZE', 1)
+
+# Maximum number of seconds a buffered vote waits before being written
+VOTE_BUFFER_INTERVAL = get_env_number('POLLS_VOTE_BUFFER_INTERVAL', 1.0, float)
+
+# The JSON encoder used to render responses, either `json`, `orjson` or
+# `ujson`. The latter two require the package of the same name.
+JSON_ENCODER = os.environ.get('POLLS_JSON_ENCODER', 'json')
+
+# Stream collections rendered as plain JSON arrays as each item is serialized,
+# other responses are never streamed. Streamed responses are not cached on the
+# server.
+STREAM_RESPONSES = get_env('POLLS_STREAM_RESPONSES', 'false')
+
+# Number of votes a second each client may make, in bursts of up to
+# `VOTE_BURST` votes. A rate of 0, the default, disables the limit. Clients
+# are identified by `THROTTLE_CLIENT_HEADER`, which must be configured behind
+# a proxy before enabling the limit.
+VOTE_RATE = get_env_number('POLLS_VOTE_RATE', 0, float)
+VOTE_BURST = get_env_number('POLLS_VOTE_BURST', 20)
+
+# The request header identifying clients for rate limiting and idempotency
+# keys, for example `HTTP_X_FORWARDED_FOR` behind a proxy
+THROTTLE_CLIENT_HEADER = os.environ.get('POLLS_THROTTLE_CLIENT_HEADER', 'REMOTE_ADDR')
+
+# Number of seconds the response to a vote with an `Idempotency-Key` header is
+# replayed to repeated requests
+IDEMPOTENCY_TIMEOUT = 24 * 60 * 60
+
+# Number of seconds repeated requests are rejected while the first is in
+# progress, bounding how long a key stays locked if its worker dies
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+
+# Maximum number of times a second the vote counts of a question are counted
+# again after votes, however many clients poll them
+TALLY_RATE = get_env_number('POLLS_TALLY_RATE', 1.0, float)
+
+# Number of seconds after which polled questions are counted again, picking
+# up votes made in other processes
+TALLY_REFRESH_INTERVAL = get_env_number('POLLS_TALLY_REFRESH_INTERVAL', 5.0, float)
+
+# Record the queries, phase timings and response size of each request, and
+# return them in a `Server-Timing` header, log them and serve metrics of them
+# at `/metrics`. The metrics should not be exposed publicly.
+INSTRUMENTATION = get_env('POLLS_INSTRUMENTATION', 'false')
+
+# Number of seconds a client reads from the primary database after writing,
+# so that it reads its own writes despite replication lag
+REPLICA_STICKINESS = get_env_number('POLLS_REPLICA_STICKINESS', 10)
+
+# Use the PostgreSQL row estimate instead of counting questions once there are
+# at least this many questions
+COUNT_ESTIMATE_THRESHOLD = get_env_number('POLLS_COUNT_ESTIMATE_THRESHOLD', 100000)
+
 
 X_FRAME_OPTIONS = 'DENY'
 
+
+# Logging
+
+# Informational messages of the polls API, such as the lines logged for each
+# instrumented request, are written to stderr
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {'polls': {'handlers': ['console'], 'level': 'INFO'}},
+}
+
+
 # CORS Headers
 
 CORS_ORIGIN_ALLOW_ALL = True
@@ -0,0 +1,128 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from polls.models import Choice, Question
+from polls.resource import encoder
+from polls.votes import vote_buffer
+
+
+def get_tally(question_pk):
+    """
+    Returns the encoded vote counts of the choices of a question, counting
+    votes which are still buffered, or `None` when the question does not
+    exist.
+    """
+
+    choices = (
+        Choice.objects.filter(question_id=question_pk)
+        .only('question_id', 'choice_text', 'vote_count')
+        .order_by('-vote_count', 'choice_text')
+    )
+    tally = []
+
+    for choice in choices:
+        votes = choice.vote_count
+        if vote_buffer is not None:
+            votes += vote_buffer.count(choice)
+
+        tally.append(
+            {
+                'url': '/questions/{}/choices/{}'.format(question_pk, choice.pk),
+                'choice': choice.choice_text,
+                'votes': votes,
+            }
+        )
+
+    if not tally and not Question.objects.filter(pk=question_pk).exists():
+        return None
+
+    return encode_tally(question_pk, tally)
+
+
+def encode_tally(question_pk, choices):
+    data = encoder.dumps(
+        {'url': '/questions/{}'.format(question_pk), 'choices': choices}
+    )
+
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    return data
+
+
+class TallyBroker(object):
+    """
+    Keeps the latest vote counts of the questions polled in this process, so
+    that polls are answered at once without counting the votes again.
+
+    Votes mark their question as changed, a changed question is counted again
+    once `1 / rate` seconds have passed since it was last counted. However
+    many clients poll a question, it is therefore counted at most `rate` times
+    a second. Votes in other processes are not published, questions are
+    therefore also counted every `refresh_interval` seconds. Each tally is
+    identified by the digest of its encoded data.
+
+    The tallies of at most `max_entries` questions are kept, the least
+    recently polled are dropped first.
+    """
+
+    def __init__(self, rate=None, refresh_interval=None, max_entries=1000):
+        self.interval = 1 / rate if rate else 0
+        self.refresh_interval = refresh_interval
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.changed = set()
+        self.tallies = OrderedDict()
+
+    def publish(self, question_pk):
+        with self.lock:
+            if question_pk in self.tallies:
+                self.changed.add(question_pk)
+
+    def get(self, question_pk):
+        """
+        Returns a `(digest, data)` tuple of the latest tally of a question, or
+        `None` when the question does not exist.
+        """
+
+        now = time.monotonic()
+
+        with self.lock:
+            entry = self.tallies.get(question_pk)
+            if entry is not None and not self.is_stale(question_pk, entry[0], now):
+                self.tallies.move_to_end(question_pk)
+                return entry[1]
+
+            # Votes published while counting mark the question again
+            self.changed.discard(question_pk)
+
+        data = get_tally(question_pk)
+        if data is None:
+            return None
+
+        tally = (hashlib.md5(data).hexdigest(), data)
+
+        with self.lock:
+            self.tallies[question_pk] = (now, tally)
+            self.tallies.move_to_end(question_pk)
+
+            while len(self.tallies) > self.max_entries:
+                dropped, _ = self.tallies.popitem(last=False)
+                self.changed.discard(dropped)
+
+        return tally
+
+    def is_stale(self, question_pk, counted_at, now):
+        age = now - counted_at
+
+        if question_pk in self.changed and age >= self.interval:
+            return True
+
+        return self.refresh_interval is not None and age >= self.refresh_interval
+
+
+broker = TallyBroker(settings.TALLY_RATE, settings.TALLY_REFRESH_INTERVAL)
@@ -1,11 +1,75 @@
+import base64
 import json
-
-from django.http import HttpRequest
-from django.test import Client, TestCase
-
-from polls.models import Choice, Question
-from polls.resource import Action, Resource
-from polls.views import QuestionResource
+import re
+from contextlib import redirect_stdout
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import BaseCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import (
+    DatabaseError,
+    IntegrityError,
+    OperationalError,
+    connection,
+    router,
+)
+from django.db.models import F
+from django.http import Http404, HttpRequest, HttpResponse
+from django.test import (
+    Client,
+    RequestFactory,
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.module_loading import import_string
+
+from polls.caches import PooledClientMixin, parse_cache_url
+from polls.encoders import get_encoder
+from polls.features import (
+    DatabaseBackend,
+    EnvironmentBackend,
+    FeatureFlags,
+    get_backend,
+    get_initial_question_pks,
+    is_feature_enabled,
+)
+from polls.generations import (
+    QUESTIONS,
+    get_generations,
+    invalidate_questions,
+    question_key,
+)
+from polls.health import database_probe, get_pool_stats
+from polls.instrumentation import metrics, metrics_view
+from polls.management.commands.cleanup import Command as CleanupCommand
+from polls.models import Choice, Feature, Question, Vote, fingerprint
+from polls.pool import ConnectionPool, PoolTimeout
+from polls.resource import (
+    Action,
+    Attribute,
+    Resource,
+    negotiate_content_type,
+    to_hal,
+    to_json,
+    to_siren,
+)
+from polls.routers import ReplicaMiddleware, read_database
+from polls.tallies import TallyBroker
+from polls.throttling import get_client, vote_bucket, vote_idempotency
+from polls.views import (
+    ChoiceResource,
+    QuestionCollectionResource,
+    QuestionResource,
+    QuestionTallyView,
+)
+from polls.votes import VoteBuffer
 
 
 class ResourceTestCase(TestCase):
@@ -20,6 +84,24 @@ class ResourceTestCase(TestCase):
 
         self.assertEqual(response['Allow'], 'HEAD, GET, DELETE')
 
+    def test_relations_are_computed_once_per_response(self):
+        calls = []
+
+        class TestRelationsResource(Resource):
+            def get_relations(self):
+                calls.append(True)
+                return {'next': Resource()}
+
+            def can_embed(self, relation):
+                return False
+
+        request = HttpRequest()
+        request.META['HTTP_ACCEPT'] = 'application/json'
+        response = TestRelationsResource().get(request)
+
+        self.assertEqual(response['Link'], '<None>; rel="next"')
+        self.assertEqual(len(calls), 1)
+
     def test_invalid_accept_header(self):
         class TestResource(Resource):
             pass
@@ -30,6 +112,217 @@ class ResourceTestCase(TestCase):
 
         self.assertEqual(response.status_code, 200)
 
+    def test_link_header_template(self):
+        class LinkResource(Resource):
+            def __init__(self, uri=None):
+                self.uri = uri
+
+            def get_uri(self):
+                return self.uri
+
+            def get_relations(self):
+                return {
+                    'next': LinkResource('/next'),
+                    'prev': LinkResource('/prev'),
+                }
+
+            def can_embed(self, relation):
+                return False
+
+        response = LinkResource('/').render(HttpRequest(), 'application/json')
+        LinkResource('/').render(HttpRequest(), 'application/json')
+
+        self.assertEqual(response['Link'], '</next>; rel="next", </prev>; rel="prev"')
+        self.assertEqual(response['Allow'], 'HEAD, GET')
+        self.assertEqual(
+            LinkResource._link_templates,
+            {
+                ('next', 'prev'): (
+                    ('next', 'prev'),
+                    '<{}>; rel="next", <{}>; rel="prev"',
+                )
+            },
+        )
+
+    def test_content_negotiation_is_cached(self):
+        negotiate_content_type.cache_clear()
+        request = HttpRequest()
+        request.META['HTTP_ACCEPT'] = 'application/hal+json, */*;q=0.1'
+
+        for _ in range(2):
+            content_type = Resource().determine_content_type(request)
+            self.assertEqual(content_type, 'application/hal+json')
+
+        self.assertEqual(negotiate_content_type.cache_info().hits, 1)
+
+    def test_content_handlers_built_once_per_class(self):
+        class TestResource(Resource):
+            pass
+
+        handlers = TestResource.get_content_handlers()
+
+        self.assertIs(TestResource().get_content_handlers(), handlers)
+        self.assertIsNot(QuestionCollectionResource.get_content_handlers(), handlers)
+        self.assertIsNot(
+            QuestionCollectionResource.get_content_handlers()['application/json'],
+            handlers['application/json'],
+        )
+
+
+class SerializerTestCase(TestCase):
+    """
+    Serialized documents are compared as JSON strings so that key order is
+    verified too.
+    """
+
+    def setUp(self):
+        class ItemResource(Resource):
+            uri = '/items/1'
+
+            def get_attributes(self):
+                return {'name': 'Item'}
+
+        class NextResource(Resource):
+            uri = '/next'
+
+        class PageResource(Resource):
+            uri = '/pages/1'
+
+            def get_attributes(self):
+                raise AssertionError('Linked resources are not serialized')
+
+        class TestResource(Resource):
+            uri = '/test'
+
+            def get_attributes(self):
+                return {'count': 1}
+
+            def get_relations(self):
+                return {
+                    'items': [ItemResource()],
+                    'next': NextResource(),
+                    'item': ItemResource(),
+                    'pages': [PageResource()],
+                }
+
+            def can_embed(self, relation):
+                return relation not in ('next', 'pages')
+
+            def get_actions(self):
+                return {
+                    'create': Action(
+                        method='POST', attributes=(Attribute('name', 'text'),)
+                    )
+                }
+
+        self.resource = TestResource()
+
+    def assertDocumentEqual(self, document, expected):
+        self.assertEqual(json.dumps(document), json.dumps(expected))
+
+    def test_to_json(self):
+        self.assertDocumentEqual(
+            to_json(self.resource),
+            {
+                'count': 1,
+                'url': '/test',
+                'items': [{'name': 'Item', 'url': '/items/1'}],
+                'next_url': '/next',
+                'item': {'name': 'Item', 'url': '/items/1'},
+                'pages': [{'url': '/pages/1'}],
+            },
+        )
+
+    def test_to_hal(self):
+        item = {'name': 'Item', '_links': {'self': {'href': '/items/1'}}}
+
+        self.assertDocumentEqual(
+            to_hal(self.resource),
+            {
+                'count': 1,
+                '_links': {
+                    'next': {'href': '/next'},
+                    'pages': [{'href': '/pages/1'}],
+                    'self': {'href': '/test'},
+                },
+                '_embed': {'items': [item], 'item': item},
+            },
+        )
+
+    def test_to_siren(self):
+        def item(rel):
+            return {
+                'properties': {'name': 'Item'},
+                'links': [{'rel': ['self'], 'href': '/items/1'}],
+                'rel': [rel],
+            }
+
+        self.assertDocumentEqual(
+            to_siren(self.resource),
+            {
+                'properties': {'count': 1},
+                'links': [
+                    {'rel': ['next'], 'href': '/next'},
+                    {'rel': ['pages'], 'href': '/pages/1'},
+                    {'rel': ['self'], 'href': '/test'},
+                ],
+                'entities': [item('items'), item('item')],
+                'actions': [
+                    {
+                        'name': 'create',
+                        'method': 'POST',
+                        'href': '/test',
+                        'type': 'application/json',
+                        'fields': [{'name': 'name', 'type': 'text', 'title': 'Name'}],
+                    }
+                ],
+            },
+        )
+
+
+def is_installed(module):
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+class EncoderTestCase(TestCase):
+    document = {'url': '/questions/1', 'choices': [{'choice': 'Café', 'votes': 1}]}
+
+    def assertEncodes(self, encoder):
+        self.assertEqual(json.loads(encoder.encode(self.document)), self.document)
+
+        items = iter([self.document, self.document])
+        content = b''.join(
+            chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+            for chunk in encoder.iterencode(items)
+        )
+        self.assertEqual(json.loads(content), [self.document, self.document])
+
+    def test_json(self):
+        encoder = get_encoder('json')
+
+        self.assertEqual(encoder.encode(self.document), json.dumps(self.document))
+        self.assertEqual(''.join(encoder.iterencode(iter([1, 2]))), json.dumps([1, 2]))
+        self.assertEncodes(encoder)
+
+    @skipUnless(is_installed('orjson'), 'orjson is not installed')
+    def test_orjson(self):
+        self.assertEncodes(get_encoder('orjson'))
+
+    @skipUnless(is_installed('ujson'), 'ujson is not installed')
+    def test_ujson(self):
+        encoder = get_encoder('ujson')
+
+        self.assertEncodes(encoder)
+        self.assertIn('"/questions/1"', encoder.encode(self.document))
+
+    def test_unknown_encoder(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_encoder('simplejson')
+
 
 class RootTestCase(TestCase):
     def test_supports_cors(self):
@@ -43,6 +336,7 @@ class RootTestCase(TestCase):
 class QuestionListTestCase(TestCase):
     def setUp(self):
         self.client = Client()
+        cache.clear()
 
     def test_unfound_page(self):
         response = self.client.get('/questions?page=5', secure=True)
@@ -54,10 +348,174 @@ class QuestionListTestCase(TestCase):
 
         self.assertEqual(response.status_code, 404)
 
+    def create_questions(self, count):
+        for _ in range(count):
+            question = Question.objects.create(question_text='Question?')
+            for choice_text in ('A', 'B', 'C'):
+                Choice.objects.create(question=question, choice_text=choice_text)
+
+    def get_questions(self, uri='/questions'):
+        request = RequestFactory().get(uri, HTTP_ACCEPT='application/hal+json')
+        response = QuestionCollectionResource.as_view()(request)
+        return json.loads(response.content)
+
+    @mock.patch.object(QuestionCollectionResource, 'cache_timeout', None)
+    def test_query_count_is_independent_of_page_size(self):
+        # The version, the page of questions and their choices
+        self.create_questions(2)
+        with self.assertNumQueries(3):
+            document = self.get_questions()
+        self.assertEqual(len(document['_embed']['questions']), 2)
+
+        self.create_questions(30)
+        with self.assertNumQueries(3):
+            document = self.get_questions()
+        self.assertEqual(len(document['_embed']['questions']), 20)
+
+        with self.assertNumQueries(4):
+            document = self.get_questions('/questions?page=2')
+        self.assertEqual(len(document['_embed']['questions']), 12)
+
+    def test_cursor_pagination(self):
+        self.create_questions(25)
+        questions = list(Question.objects.order_by('-published_at', '-id'))
+
+        def question_uris(document):
+            return [
+                q['_links']['self']['href'] for q in document['_embed']['questions']
+            ]
+
+        def expected_uris(questions):
+            return ['/questions/{}'.format(q.pk) for q in questions]
+
+        first_page = self.get_questions()
+        self.assertEqual(question_uris(first_page), expected_uris(questions[:20]))
+        self.assertNotIn('prev', first_page['_links'])
+        self.assertNotIn('last', first_page['_links'])
+
+        second_page = self.get_questions(first_page['_links']['next']['href'])
+        self.assertEqual(question_uris(second_page), expected_uris(questions[20:]))
+        self.assertNotIn('next', second_page['_links'])
+
+        previous_page = self.get_questions(second_page['_links']['prev']['href'])
+        self.assertEqual(question_uris(previous_page), expected_uris(questions[:20]))
+        self.assertNotIn('prev', previous_page['_links'])
+        self.assertIn('next', previous_page['_links'])
+
+    @mock.patch.object(QuestionCollectionResource, 'cache_timeout', None)
+    def test_page_count_is_cached_until_invalidated(self):
+        self.create_questions(15)
+
+        with self.assertNumQueries(4):
+            document = self.get_questions('/questions?page=1')
+        self.assertNotIn('last', document['_links'])
+
+        with self.assertNumQueries(3):
+            self.get_questions('/questions?page=1')
+
+        for i in range(10):
+            QuestionCollectionResource().create_question(
+                'Question {}?'.format(i), ['A', 'B']
+            )
+
+        with self.assertNumQueries(4):
+            document = self.get_questions('/questions?page=1')
+        self.assertEqual(document['_links']['last']['href'], '/questions?page=2')
+
+    def test_response_is_cached_until_changed(self):
+        self.create_questions(1)
+        self.get_questions()
+
+        # Only the version is read from the database
+        with mock.patch.object(QuestionCollectionResource, 'render') as render:
+            with self.assertNumQueries(1):
+                self.get_questions()
+        self.assertFalse(render.called)
+
+        # Written without bumping the generations, as another process would
+        Choice.objects.filter(choice_text='A').update(
+            vote_count=5, modified_at=timezone.now()
+        )
+
+        document = self.get_questions()
+        question = document['_embed']['questions'][0]
+        self.assertEqual(question['_embed']['choices'][0]['votes'], 5)
+
+    def test_other_parameters_are_not_cached_apart(self):
+        self.create_questions(1)
+        client = Client()
+        responses = {
+            path: client.get(path, secure=True)
+            for path in ('/questions', '/questions?page=1')
+        }
+
+        with mock.patch('polls.resource.cache.set') as cache_set:
+            for path, other_path in (
+                ('/questions', '/questions?utm_source=1'),
+                ('/questions?page=1', '/questions?x=2&page=1'),
+            ):
+                response = client.get(other_path, secure=True)
+                self.assertEqual(response['ETag'], responses[path]['ETag'])
+
+        cache_set.assert_not_called()
+
+    def test_json_query_count(self):
+        self.create_questions(5)
+        request = RequestFactory().get('/questions', HTTP_ACCEPT='application/json')
+
+        with self.assertNumQueries(3):
+            response = QuestionCollectionResource.as_view()(request)
+
+        self.assertEqual(len(json.loads(response.content)), 5)
+
+    @override_settings(STREAM_RESPONSES=True)
+    def test_streaming_response(self):
+        self.create_questions(3)
+        request = RequestFactory().get('/questions', HTTP_ACCEPT='application/json')
+        response = QuestionCollectionResource.as_view()(request)
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        questions = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(questions), 3)
+        self.assertEqual(questions[0]['choices'][0]['choice'], 'A')
+
+    @override_settings(STREAM_RESPONSES=True)
+    def test_only_json_collections_are_streamed(self):
+        self.create_questions(1)
+        question = Question.objects.get()
+        factory = RequestFactory()
+
+        request = factory.get('/questions', HTTP_ACCEPT='application/hal+json')
+        response = QuestionCollectionResource.as_view()(request)
+        self.assertFalse(response.streaming)
+
+        request = factory.get('/questions/{}'.format(question.pk))
+        response = QuestionResource.as_view()(request, pk=question.pk)
+        self.assertFalse(response.streaming)
+
+    def test_invalid_cursor(self):
+        cursors = ['invalid'] + [
+            base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode()
+            for payload in (
+                ['next', [1], '2'],
+                ['next', {'a': 1}, '2'],
+                ['next', None, '2'],
+                ['prev', 1, 2],
+                ['next'],
+                5,
+            )
+        ]
+
+        for cursor in cursors:
+            response = self.client.get('/questions', {'cursor': cursor}, secure=True)
+            self.assertEqual(response.status_code, 404, cursor)
+
 
 class CreateQuestionTestCase(TestCase):
     def setUp(self):
         self.client = Client()
+        cache.clear()
 
     def test_creating_question(self):
         response = self.client.post(
@@ -125,6 +583,81 @@ class CreateQuestionTestCase(TestCase):
         self.assertEqual(response2.status_code, 201)
         self.assertEqual(len(Question.objects.all()), original_question_count + 2)
 
+    def test_creating_question_is_atomic(self):
+        original_question_count = Question.objects.count()
+
+        # Choices are saved one by one where bulk inserts return no keys
+        bulk_create = mock.patch.object(
+            Choice.objects, 'bulk_create', side_effect=IntegrityError
+        )
+        save = mock.patch.object(Choice, 'save', side_effect=IntegrityError)
+
+        with bulk_create, save, self.assertRaises(IntegrityError):
+            QuestionCollectionResource().create_question('Question?', ['A', 'B'])
+
+        self.assertEqual(Question.objects.count(), original_question_count)
+
+    def post_batch(self, count, offset=0):
+        body = [
+            {'question': 'Question {}?'.format(i), 'choices': ['A', 'B', 'C']}
+            for i in range(offset, offset + count)
+        ]
+        return self.client.post(
+            '/questions', json.dumps(body), content_type='application/json', secure=True
+        )
+
+    def test_creating_questions_in_batch(self):
+        response = self.post_batch(2)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [q['question'] for q in json.loads(response.content)],
+            ['Question 0?', 'Question 1?'],
+        )
+
+        question = Question.objects.get(question_text='Question 1?')
+        self.assertEqual(
+            [c.choice_text for c in question.choices.order_by('choice_text')],
+            ['A', 'B', 'C'],
+        )
+
+    def test_creating_existing_questions_in_batch_doesnt_duplicate(self):
+        self.post_batch(2)
+        original_question_count = Question.objects.count()
+
+        response = self.post_batch(2)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Question.objects.count(), original_question_count)
+
+    @skipUnless(
+        getattr(
+            connection.features,
+            'can_return_rows_from_bulk_insert',
+            getattr(connection.features, 'can_return_ids_from_bulk_insert', False),
+        ),
+        'Bulk inserts do not return primary keys',
+    )
+    def test_creating_questions_in_batch_query_count(self):
+        with CaptureQueriesContext(connection) as small_batch:
+            self.post_batch(5)
+
+        with CaptureQueriesContext(connection) as large_batch:
+            self.post_batch(50, offset=5)
+
+        self.assertEqual(Question.objects.count(), 55)
+        self.assertEqual(len(small_batch), len(large_batch))
+
+    def test_creating_questions_with_invalid_batch(self):
+        response = self.client.post(
+            '/questions',
+            '[{"question": "Test Question?", "choices": ["A"]}]',
+            content_type='application/json',
+            secure=True,
+        )
+
+        self.assertEqual(response.status_code, 400)
+
     def test_creating_question_without_body(self):
         response = self.client.post(
             '/questions', content_type='application/json', secure=True
@@ -132,6 +665,44 @@ class CreateQuestionTestCase(TestCase):
 
         self.assertEqual(response.status_code, 400)
 
+    def test_creating_question_with_different_whitespace_doesnt_duplicate(self):
+        response1 = self.client.post(
+            '/questions',
+            '{"question": "Test Question?", "choices": ["A", "B"]}',
+            content_type='application/json',
+            secure=True,
+        )
+        response2 = self.client.post(
+            '/questions',
+            '{"question": " Test  Question? ", "choices": ["B ", "A"]}',
+            content_type='application/json',
+            secure=True,
+        )
+
+        self.assertEqual(response1.status_code, 201)
+        self.assertEqual(response2.status_code, 200)
+        self.assertEqual(response1['Location'], response2['Location'])
+
+    def test_concurrently_created_question_is_found(self):
+        resource = QuestionCollectionResource()
+        question = resource.create_question('Test Question?', ['A', 'B'])
+        get_objects = resource.get_objects
+        lookups = []
+
+        def get_objects_after_race():
+            # The first lookup misses the question, as if a concurrent request
+            # created it after the lookup
+            lookups.append(True)
+            if len(lookups) == 1:
+                return Question.objects.none()
+            return get_objects()
+
+        with mock.patch.object(resource, 'get_objects', get_objects_after_race):
+            result = resource.get_or_create('Test Question?', ['B', 'A'])
+
+        self.assertEqual(result, (question, False))
+        self.assertEqual(len(lookups), 2)
+
     def test_creating_question_with_invalid_question(self):
         response = self.client.post(
             '/questions',
@@ -166,6 +737,7 @@ class CreateQuestionTestCase(TestCase):
 class QuestionDetailTestCase(TestCase):
     def setUp(self):
         self.client = Client()
+        cache.clear()
 
     def test_choices_ordered_by_votes_then_alphabetical(self):
         question = Question.objects.create(
@@ -184,17 +756,34 @@ class QuestionDetailTestCase(TestCase):
         yes_choice.vote()
         self.assertEqual(get_choices(), [yes_choice, no_choice])
 
+    def test_query_count(self):
+        question = Question.objects.create(question_text='Question?')
+        Choice.objects.create(question=question, choice_text='A')
+        request = RequestFactory().get('/questions/{}'.format(question.pk))
+
+        with self.assertNumQueries(2):
+            QuestionResource.as_view()(request, pk=question.pk)
+
     def test_unfound_page(self):
         response = self.client.get('/questions/1337', secure=True)
 
         self.assertEqual(response.status_code, 404)
 
     def test_deleting_question(self):
-        question = Question.objects.create(question_text='Can I delete a question?')
+        question = Question.objects.create(
+            pk=100, question_text='Can I delete a question?'
+        )
         response = self.client.delete('/questions/{}'.format(question.pk), secure=True)
 
         self.assertEqual(response.status_code, 204)
 
+    def test_deleting_initial_question(self):
+        Question.objects.create(pk=1, question_text='Can I delete a question?')
+
+        for _ in range(2):
+            response = self.client.delete('/questions/1', secure=True)
+            self.assertEqual(response.status_code, 405)
+
     def test_deleting_unknown_question(self):
         response = self.client.delete('/questions/1234', secure=True)
 
@@ -204,6 +793,7 @@ class QuestionDetailTestCase(TestCase):
 class ChoiceDetailTestCase(TestCase):
     def setUp(self):
         self.client = Client()
+        cache.clear()
 
     def test_get_choice(self):
         question = Question.objects.create(question_text='Testing Question?')
@@ -244,24 +834,1077 @@ class ChoiceDetailTestCase(TestCase):
             {'url': path, 'choice': 'Best Choice', 'votes': 1},
         )
 
+    def test_vote_invalidates_cached_responses(self):
+        question = Question.objects.create(question_text='Testing Question?')
+        choice = Choice.objects.create(question=question, choice_text='Best Choice')
+
+        question_path = '/questions/{}'.format(question.pk)
+        choice_path = '{}/choices/{}'.format(question_path, choice.pk)
+
+        def get_votes():
+            question = json.loads(self.client.get(question_path, secure=True).content)
+            choice = json.loads(self.client.get(choice_path, secure=True).content)
+            questions = json.loads(self.client.get('/questions', secure=True).content)
+            return (
+                question['choices'][0]['votes'],
+                choice['votes'],
+                questions[0]['choices'][0]['votes'],
+            )
+
+        self.assertEqual(get_votes(), (0, 0, 0))
+        self.client.post(choice_path, secure=True)
+        self.assertEqual(get_votes(), (1, 1, 1))
+
     def test_vote_unknown_choice(self):
         response = self.client.post('/questions/1/choices/5', secure=True)
 
         self.assertEqual(response.status_code, 404)
 
 
+class ChoiceVoteCountTestCase(TestCase):
+    def setUp(self):
+        question = Question.objects.create(question_text='Testing Question?')
+        self.choice = Choice.objects.create(question=question, choice_text='Choice')
+
+    def test_vote_increments_vote_count(self):
+        self.choice.vote()
+        self.choice.vote()
+
+        self.assertEqual(self.choice.vote_count, 2)
+        self.assertEqual(Choice.objects.get(pk=self.choice.pk).vote_count, 2)
+
+    def test_reconcile_votes(self):
+        self.choice.vote()
+        Vote.objects.create(choice=self.choice)
+
+        with redirect_stdout(StringIO()):
+            call_command('reconcile_votes')
+
+        self.assertEqual(Choice.objects.get(pk=self.choice.pk).vote_count, 2)
+
+    def test_reconcile_votes_changes_validators(self):
+        Vote.objects.create(choice=self.choice)
+        Choice.objects.update(modified_at=timezone.now() - timedelta(minutes=1))
+        path = '/questions/{}/choices/{}'.format(
+            self.choice.question_id, self.choice.pk
+        )
+        response = Client().get(path, secure=True)
+
+        with redirect_stdout(StringIO()):
+            call_command('reconcile_votes')
+
+        for header, validator in (
+            ('HTTP_IF_NONE_MATCH', response['ETag']),
+            ('HTTP_IF_MODIFIED_SINCE', response['Last-Modified']),
+        ):
+            reconciled = Client().get(path, **{header: validator, 'secure': True})
+            self.assertEqual(reconciled.status_code, 200)
+            self.assertEqual(json.loads(reconciled.content)['votes'], 1)
+
+
+class FeatureTestCase(TestCase):
+    def setUp(self):
+        self.backend = mock.Mock()
+        self.backend.load.return_value = {'question.create': False}
+        self.flags = FeatureFlags(self.backend)
+        self.request = HttpRequest()
+
+    def test_initial_question_pks(self):
+        pks = get_initial_question_pks()
+
+        self.assertIsInstance(pks, frozenset)
+        self.assertIn(1, pks)
+        self.assertIs(get_initial_question_pks(), pks)
+
+    def test_flags_override_default(self):
+        self.assertFalse(self.flags.get('question.create', True))
+        self.assertTrue(self.flags.get('question.delete', True))
+        self.backend.load.assert_called_once_with()
+
+    def test_decisions_cached_per_request(self):
+        with mock.patch('polls.features.feature_flags', self.flags):
+            self.assertFalse(is_feature_enabled('question.create', self.request, True))
+            self.backend.load.return_value = {'question.create': True}
+            self.flags.reload()
+            self.assertFalse(is_feature_enabled('question.create', self.request, True))
+            self.assertTrue(is_feature_enabled('question.create', HttpRequest(), False))
+
+    def test_decisions_without_request(self):
+        with mock.patch('polls.features.feature_flags', self.flags):
+            self.assertFalse(is_feature_enabled('question.create', None, True))
+            self.assertTrue(is_feature_enabled('question.unknown', None, True))
+
+    def test_generation_changes_with_flags(self):
+        generation = self.flags.get_generation()
+        self.flags.reload()
+        self.assertEqual(self.flags.get_generation(), generation)
+
+        self.backend.load.return_value = {'question.create': True}
+        self.flags.reload()
+        self.assertNotEqual(self.flags.get_generation(), generation)
+
+    def test_failed_load_uses_defaults(self):
+        self.backend.load.side_effect = DatabaseError
+
+        with self.assertLogs('polls.features', 'ERROR'):
+            self.assertTrue(self.flags.get('question.create', True))
+
+    def test_environment_backend(self):
+        environ = {'POLLS_FEATURE_CHOICE_VOTE': 'false', 'POLLS_OTHER': 'true'}
+
+        with mock.patch.dict('os.environ', environ):
+            self.assertEqual(EnvironmentBackend().load(), {'choice.vote': False})
+
+    def test_database_backend(self):
+        Feature.objects.create(key='question.delete', enabled=False)
+
+        self.assertEqual(DatabaseBackend().load(), {'question.delete': False})
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_backend('unknown')
+
+
+class TallyTestCase(TestCase):
+    def setUp(self):
+        self.question = Question.objects.create(question_text='Question?')
+        self.choice = Choice.objects.create(question=self.question, choice_text='A')
+        Choice.objects.create(question=self.question, choice_text='B')
+        self.broker = TallyBroker(rate=1, refresh_interval=5)
+        patcher = mock.patch('polls.views.tally_broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.uri = '/questions/{}/tally'.format(self.question.pk)
+
+    def get_votes(self, data):
+        return [choice['votes'] for choice in json.loads(data)['choices']]
+
+    def test_votes_are_coalesced(self):
+        digest, data = self.broker.get(self.question.pk)
+        self.assertEqual(self.get_votes(data), [0, 0])
+
+        for _ in range(3):
+            self.choice.vote()
+            self.broker.publish(self.question.pk)
+
+        # Counted again at most once a second
+        with self.assertNumQueries(0):
+            self.assertEqual(self.broker.get(self.question.pk)[0], digest)
+
+        with mock.patch('polls.tallies.time.monotonic', return_value=10**9):
+            with self.assertNumQueries(1):
+                tally = self.broker.get(self.question.pk)
+            with self.assertNumQueries(0):
+                self.broker.get(self.question.pk)
+
+        self.assertNotEqual(tally[0], digest)
+        self.assertEqual(self.get_votes(tally[1]), [3, 0])
+
+    def test_votes_in_other_processes_are_refreshed(self):
+        now = 10**9
+        with mock.patch('polls.tallies.time.monotonic', return_value=now):
+            digest, _ = self.broker.get(self.question.pk)
+
+        self.choice.vote()
+
+        with mock.patch('polls.tallies.time.monotonic', return_value=now + 4):
+            self.assertEqual(self.broker.get(self.question.pk)[0], digest)
+        with mock.patch('polls.tallies.time.monotonic', return_value=now + 5):
+            self.assertNotEqual(self.broker.get(self.question.pk)[0], digest)
+
+    def test_least_recently_polled_are_dropped(self):
+        self.broker.max_entries = 1
+        other = Question.objects.create(question_text='Other?')
+
+        self.broker.get(self.question.pk)
+        self.broker.get(other.pk)
+
+        self.assertEqual(list(self.broker.tallies), [other.pk])
+
+    def test_poll(self):
+        view = QuestionTallyView.as_view()
+        request = RequestFactory().get(self.uri)
+        response = view(request, pk=self.question.pk)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(self.get_votes(response.content), [0, 0])
+
+        request = RequestFactory().get(self.uri, HTTP_IF_NONE_MATCH=response['ETag'])
+        with self.assertNumQueries(0):
+            not_modified = view(request, pk=self.question.pk)
+
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    def test_unknown_question(self):
+        request = RequestFactory().get('/questions/1234/tally')
+
+        with self.assertRaises(Http404):
+            QuestionTallyView.as_view()(request, pk=1234)
+
+        self.assertFalse(self.broker.tallies)
+
+
+class VoteThrottlingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        question = Question.objects.create(question_text='Question?')
+        self.choice = Choice.objects.create(question=question, choice_text='A')
+        self.uri = '/questions/{}/choices/{}'.format(question.pk, self.choice.pk)
+
+    def vote(self, **headers):
+        request = RequestFactory().post(self.uri, **headers)
+        return ChoiceResource.as_view()(
+            request, question_pk=self.choice.question_id, pk=self.choice.pk
+        )
+
+    def test_votes_are_not_rate_limited_by_default(self):
+        self.assertEqual(vote_bucket.rate, 0)
+
+        for _ in range(vote_bucket.burst + 1):
+            self.assertEqual(self.vote().status_code, 201)
+
+    @mock.patch.object(vote_bucket, 'rate', 5.0)
+    @mock.patch.object(vote_bucket, 'burst', 2)
+    def test_votes_are_rate_limited(self):
+        self.assertEqual(self.vote().status_code, 201)
+        self.assertEqual(self.vote().status_code, 201)
+
+        with self.assertNumQueries(0):
+            response = self.vote()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.vote(REMOTE_ADDR='10.0.0.1').status_code, 201)
+        self.assertEqual(Vote.objects.count(), 3)
+
+    @override_settings(THROTTLE_CLIENT_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_client_behind_proxy(self):
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='1.1.1.1, 2.2.2.2')
+
+        self.assertEqual(get_client(request), '2.2.2.2')
+
+    def test_idempotent_votes_are_replayed(self):
+        first = self.vote(HTTP_IDEMPOTENCY_KEY='a')
+        repeated = self.vote(HTTP_IDEMPOTENCY_KEY='a')
+        other = self.vote(HTTP_IDEMPOTENCY_KEY='b')
+
+        self.assertEqual(repeated.status_code, 201)
+        self.assertEqual(repeated.content, first.content)
+        self.assertEqual(json.loads(other.content)['votes'], 2)
+        self.assertEqual(Vote.objects.count(), 2)
+
+    def test_idempotent_vote_in_progress(self):
+        request = RequestFactory().post(self.uri, HTTP_IDEMPOTENCY_KEY='a')
+        key = vote_idempotency.get_cache_key(request, get_client(request))
+        cache.set(key, vote_idempotency.in_progress)
+
+        self.assertEqual(self.vote(HTTP_IDEMPOTENCY_KEY='a').status_code, 409)
+        self.assertFalse(Vote.objects.exists())
+
+    def test_idempotent_vote_is_locked_briefly(self):
+        request = RequestFactory().post(self.uri, HTTP_IDEMPOTENCY_KEY='a')
+
+        with mock.patch('polls.throttling.cache') as mock_cache:
+            mock_cache.add.return_value = True
+            vote_idempotency.respond(request, 'client', HttpResponse)
+
+        mock_cache.add.assert_called_once_with(
+            mock.ANY, vote_idempotency.in_progress, vote_idempotency.lock_timeout
+        )
+        mock_cache.set.assert_called_once_with(
+            mock.ANY, mock.ANY, vote_idempotency.timeout
+        )
+
+    def test_failed_idempotent_vote_is_unlocked(self):
+        request = RequestFactory().post(self.uri, HTTP_IDEMPOTENCY_KEY='a')
+        key = vote_idempotency.get_cache_key(request, 'client')
+
+        with self.assertRaises(KeyboardInterrupt):
+            vote_idempotency.respond(
+                request, 'client', mock.Mock(side_effect=KeyboardInterrupt)
+            )
+
+        self.assertIsNone(cache.get(key))
+
+    @override_settings(STREAM_RESPONSES=True)
+    def test_idempotent_vote_replays_response_content(self):
+        first = self.vote(HTTP_IDEMPOTENCY_KEY='a')
+        repeated = self.vote(HTTP_IDEMPOTENCY_KEY='a')
+
+        self.assertFalse(repeated.streaming)
+        self.assertEqual(repeated.status_code, 201)
+        self.assertEqual(sorted(repeated.items()), sorted(first.items()))
+        self.assertEqual(repeated.content, first.content)
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.clear()
+        Question.objects.create(question_text='Question?')
+
+    def test_disabled(self):
+        response = Client().get('/questions', secure=True)
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertFalse(hasattr(response.wsgi_request, 'timings'))
+
+    @override_settings(INSTRUMENTATION=True)
+    def test_request_is_instrumented(self):
+        with self.assertLogs('polls.instrumentation', 'INFO') as logs:
+            with CaptureQueriesContext(connection) as queries:
+                response = Client().get('/questions', secure=True)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['route'], 'questions')
+        self.assertEqual(line['status'], 200)
+        self.assertEqual(line['queries'], len(queries))
+        self.assertEqual(line['bytes'], len(response.content))
+        self.assertEqual(
+            list(line['phases']),
+            ['negotiate', 'version', 'cache', 'relations', 'serialize', 'encode'],
+        )
+
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^negotiate;dur=[0-9.]+, version;dur=')
+        self.assertIn('db;dur=', timing)
+        self.assertIn(';desc="{} queries"'.format(len(queries)), timing)
+        self.assertRegex(timing, r'total;dur=[0-9.]+$')
+
+        content = metrics_view(HttpRequest()).content.decode('utf-8')
+        self.assertIn(
+            'polls_requests_total{method="GET",route="questions",status="200"} 1',
+            content,
+        )
+        self.assertIn(
+            'polls_request_duration_seconds_count{method="GET",route="questions"} 1',
+            content,
+        )
+        self.assertIn(
+            'polls_db_queries_total{{method="GET",route="questions"}} {}'.format(
+                len(queries)
+            ),
+            content,
+        )
+
+    @override_settings(INSTRUMENTATION=True)
+    def test_cached_response_is_not_rendered(self):
+        client = Client()
+        with self.assertLogs('polls.instrumentation', 'INFO') as logs:
+            client.get('/questions', secure=True)
+            client.get('/questions', secure=True)
+
+        line = json.loads(logs.records[1].getMessage())
+        self.assertEqual(list(line['phases']), ['negotiate', 'version', 'cache'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def route(self, method, view, status=200):
+        """
+        Returns the database a request to `view` reads from.
+        """
+
+        databases = []
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            databases.append(router.db_for_read(Question))
+            return HttpResponse(status=status)
+
+        middleware = ReplicaMiddleware(get_response)
+        middleware(RequestFactory().generic(method, '/'))
+        self.assertIsNone(read_database.get())
+        return databases[0]
+
+    def test_resources_are_read_from_replica(self):
+        for resource in (QuestionResource, QuestionCollectionResource):
+            self.assertEqual(self.route('GET', resource.as_view()), 'replica1')
+            self.assertEqual(self.route('HEAD', resource.as_view()), 'replica1')
+
+    def test_writes_are_read_from_primary(self):
+        self.assertEqual(self.route('POST', ChoiceResource.as_view()), 'default')
+        self.assertEqual(router.db_for_write(Question), 'default')
+
+    def test_other_views_are_read_from_primary(self):
+        self.assertEqual(self.route('GET', QuestionTallyView.as_view()), 'default')
+
+    def test_client_reads_its_writes(self):
+        self.route('POST', QuestionCollectionResource.as_view(), status=201)
+
+        self.assertEqual(self.route('GET', QuestionResource.as_view()), 'default')
+
+    @override_settings(REPLICA_STICKINESS=0)
+    def test_stickiness_disabled(self):
+        self.route('POST', QuestionCollectionResource.as_view(), status=201)
+
+        self.assertEqual(self.route('GET', QuestionResource.as_view()), 'replica1')
+
+    def test_failed_write_does_not_pin_client(self):
+        self.route('POST', ChoiceResource.as_view(), status=429)
+
+        self.assertEqual(self.route('GET', QuestionResource.as_view()), 'replica1')
+
+    # The replica is stood in for by the lagging choice
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_lagging_replica_render_has_own_version(self):
+        question = Question.objects.create(question_text='Question?')
+        choice = Choice.objects.create(question=question, choice_text='A')
+        path = '/questions/{}/choices/{}'.format(question.pk, choice.pk)
+        lagging = Choice.objects.get(pk=choice.pk)
+        choice.vote()
+        current = Client().get(path, secure=True)
+
+        # Read from a replica which has not caught up with the vote
+        with mock.patch.object(ChoiceResource, 'get_object', return_value=lagging):
+            response = Client().get(
+                path, HTTP_IF_NONE_MATCH=current['ETag'], secure=True
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], current['ETag'])
+        self.assertEqual(json.loads(response.content)['votes'], 0)
+
+        response = Client().get(path, secure=True)
+        self.assertEqual(response['ETag'], current['ETag'])
+        self.assertEqual(json.loads(response.content)['votes'], 1)
+
+    def test_replicas_are_not_migrated(self):
+        self.assertTrue(router.allow_migrate('default', 'polls'))
+        self.assertFalse(router.allow_migrate('replica1', 'polls'))
+
+
+class CacheURLTestCase(TestCase):
+    def test_locmem(self):
+        self.assertEqual(
+            parse_cache_url('locmem://polls'),
+            {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'polls',
+            },
+        )
+
+    def test_memcached(self):
+        self.assertEqual(
+            parse_cache_url('memcached://a:11211,b:11211?key_prefix=polls'),
+            {
+                'BACKEND': 'polls.backends.memcached.PooledMemcachedCache',
+                'LOCATION': ['a:11211', 'b:11211'],
+                'KEY_PREFIX': 'polls',
+            },
+        )
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ImproperlyConfigured):
+            parse_cache_url('mongodb://localhost')
+
+
+class StandInCache(PooledClientMixin, BaseCache):
+    """
+    Stands in for a Memcached backend, its client is a new object.
+    """
+
+    def __init__(self, server, params):
+        super(StandInCache, self).__init__(params)
+        self._servers = [server]
+        self._options = params.get('OPTIONS', {})
+        self._lib = mock.Mock(Client=lambda servers, **options: object())
+
+
+class PooledCacheTestCase(TestCase):
+    def test_client_is_shared(self):
+        first = StandInCache('localhost:11211', {})
+        second = StandInCache('localhost:11211', {})
+        other = StandInCache('localhost:11211', {'OPTIONS': {'dead_retry': 4}})
+
+        self.assertIs(first._cache, second._cache)
+        self.assertIsNot(first._cache, other._cache)
+
+    def test_client_is_kept_open(self):
+        client = StandInCache('localhost:11211', {})._cache
+        StandInCache('localhost:11211', {}).close()
+
+        self.assertIs(StandInCache('localhost:11211', {})._cache, client)
+
+    @skipUnless(is_installed('memcache'), 'python-memcached is not installed')
+    def test_memcached_client_is_shared(self):
+        config = parse_cache_url('memcached://localhost:11211?dead_retry=5')
+        backend = import_string(config['BACKEND'])
+        first = backend(config['LOCATION'], config)
+        second = backend(config['LOCATION'], config)
+
+        self.assertIs(first._cache, second._cache)
+        self.assertEqual(first._cache.dead_retry, 5)
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'polls.caches.TieredCache', 'LOCATION': 'shared'},
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'polls-shared',
+        },
+    }
+)
+class TieredCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.shared = caches['shared']
+
+    def test_responses_are_kept_locally(self):
+        cache.set('polls:response:1', 'response')
+        self.shared.clear()
+
+        self.assertEqual(cache.get('polls:response:1'), 'response')
+
+    def test_shared_responses_are_kept_locally(self):
+        self.shared.set('polls:response:1', 'response')
+
+        self.assertEqual(cache.get('polls:response:1'), 'response')
+        self.shared.clear()
+        self.assertEqual(cache.get('polls:response:1'), 'response')
+
+    def test_other_keys_are_shared(self):
+        cache.set('polls:count', 1)
+        self.assertEqual(self.shared.get('polls:count'), 1)
+
+        self.shared.set('polls:count', 2)
+        self.assertEqual(cache.get('polls:count'), 2)
+
+    def test_get_many(self):
+        cache.set('polls:response:1', 'response')
+        self.shared.clear()
+        self.shared.set('polls:version:/', 1)
+
+        self.assertEqual(
+            cache.get_many(['polls:response:1', 'polls:version:/', 'polls:missing']),
+            {'polls:response:1': 'response', 'polls:version:/': 1},
+        )
+
+    def test_delete(self):
+        cache.set('polls:response:1', 'response')
+        cache.delete('polls:response:1')
+
+        self.assertIsNone(cache.get('polls:response:1'))
+        self.assertIsNone(self.shared.get('polls:response:1'))
+
+    def test_resource_is_cached(self):
+        Question.objects.create(question_text='Question?')
+        client = Client()
+        with mock.patch.object(self.shared, 'set', wraps=self.shared.set) as shared_set:
+            client.get('/questions', secure=True)
+        self.shared.delete_many(
+            [
+                call[0][0]
+                for call in shared_set.call_args_list
+                if call[0][0].startswith('polls:response:')
+            ]
+        )
+
+        with mock.patch.object(QuestionCollectionResource, 'render') as render:
+            response = client.get('/questions', secure=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(render.called)
+
+
+class CleanupTestCase(TestCase):
+    def create_question(self, pk, published_at):
+        question = Question.objects.create(
+            pk=pk, question_text='Question {}?'.format(pk)
+        )
+        Question.objects.filter(pk=pk).update(published_at=published_at)
+        choice = Choice.objects.create(question=question, choice_text='A')
+        choice.vote()
+        return question
+
+    def test_cleanup(self):
+        old = timezone.now() - timedelta(hours=2)
+        initial = self.create_question(1, old)
+        for pk in range(100, 105):
+            self.create_question(pk, old)
+        recent = self.create_question(200, timezone.now())
+
+        with redirect_stdout(StringIO()) as stdout:
+            call_command('cleanup', batch_size=2)
+
+        self.assertEqual(list(Question.objects.order_by('pk')), [initial, recent])
+        self.assertEqual(Choice.objects.count(), 2)
+        self.assertFalse(Vote.objects.exists())
+        self.assertFalse(Choice.objects.filter(vote_count__gt=0).exists())
+        self.assertIn('Deleted 5 questions', stdout.getvalue())
+        self.assertIn('Deleted 2 votes', stdout.getvalue())
+
+    def test_cleanup_age(self):
+        self.create_question(100, timezone.now() - timedelta(minutes=30))
+
+        with redirect_stdout(StringIO()):
+            call_command('cleanup', age=15)
+
+        self.assertFalse(Question.objects.exists())
+
+
+class VoteBufferTestCase(TestCase):
+    def setUp(self):
+        self.question = Question.objects.create(question_text='Testing Question?')
+        self.choice = Choice.objects.create(question=self.question, choice_text='A')
+        self.buffer = VoteBuffer(size=3)
+
+    def test_flushes_when_full(self):
+        self.buffer.add(self.choice)
+        self.buffer.add(self.choice)
+
+        self.assertEqual(len(self.buffer), 2)
+        self.assertEqual(Vote.objects.count(), 0)
+
+        self.buffer.add(self.choice)
+
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(Vote.objects.count(), 3)
+        self.assertEqual(Choice.objects.get(pk=self.choice.pk).vote_count, 3)
+
+    def test_failed_flush_keeps_votes(self):
+        self.buffer.add(self.choice)
+        self.buffer.add(self.choice)
+
+        with mock.patch.object(
+            Vote.objects, 'bulk_create', side_effect=OperationalError
+        ), self.assertLogs('polls.votes', 'ERROR'):
+            self.buffer.add(self.choice)
+
+        self.assertEqual(len(self.buffer), 3)
+        self.assertEqual(Choice.objects.get(pk=self.choice.pk).vote_count, 0)
+
+        self.buffer.add(self.choice)
+
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(Vote.objects.count(), 4)
+        self.assertEqual(Choice.objects.get(pk=self.choice.pk).vote_count, 4)
+
+    @mock.patch('polls.votes.close_old_connections')
+    def test_thread_survives_failed_flush(self, close_old_connections):
+        class Stop(Exception):
+            pass
+
+        buffer = VoteBuffer(size=10, interval=1)
+        buffer.flush = mock.Mock(side_effect=[OperationalError, 1])
+
+        with mock.patch('polls.votes.time.sleep', side_effect=[None, None, Stop]):
+            with self.assertLogs('polls.votes', 'ERROR'), self.assertRaises(Stop):
+                buffer.run()
+
+        self.assertEqual(buffer.flush.call_count, 2)
+
+    def test_flush_skips_deleted_choices(self):
+        self.buffer.add(self.choice)
+        self.choice.delete()
+
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(Vote.objects.count(), 0)
+
+    def test_vote_response_includes_buffered_vote(self):
+        path = '/questions/{}/choices/{}'.format(self.question.pk, self.choice.pk)
+
+        with mock.patch('polls.votes.vote_buffer', self.buffer):
+            response = self.client.post(path, secure=True)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(response.content)['votes'], 1)
+        self.assertEqual(Vote.objects.count(), 0)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+
+        question = Question.objects.create(question_text='Testing Question?')
+        choice = Choice.objects.create(question=question, choice_text='Choice')
+        self.question_path = '/questions/{}'.format(question.pk)
+        self.choice_path = '{}/choices/{}'.format(self.question_path, choice.pk)
+
+    def test_if_none_match(self):
+        for path in ('/', '/questions', self.question_path, self.choice_path):
+            response = self.client.get(path, secure=True)
+            self.assertEqual(response.status_code, 200)
+
+            response = self.client.get(
+                path, HTTP_IF_NONE_MATCH=response['ETag'], secure=True
+            )
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+    def test_if_modified_since(self):
+        for path in (self.question_path, self.choice_path):
+            response = self.client.get(path, secure=True)
+            self.assertEqual(response.status_code, 200)
+
+            response = self.client.get(
+                path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'], secure=True
+            )
+            self.assertEqual(response.status_code, 304)
+
+    def test_last_modified(self):
+        question = Question.objects.get()
+        modified_at = question.published_at + timedelta(minutes=1)
+        question.choices.update(modified_at=modified_at)
+
+        for path in (self.question_path, self.choice_path):
+            response = self.client.get(path, secure=True)
+            self.assertEqual(
+                response['Last-Modified'], http_date(int(modified_at.timestamp()))
+            )
+
+        # Collections change when questions are deleted, which is not
+        # recorded
+        for path in ('/', '/questions'):
+            self.assertNotIn('Last-Modified', self.client.get(path, secure=True))
+
+    def test_etag_depends_on_content_type(self):
+        json_response = self.client.get(self.question_path, secure=True)
+        hal_response = self.client.get(
+            self.question_path, HTTP_ACCEPT='application/hal+json', secure=True
+        )
+
+        self.assertNotEqual(json_response['ETag'], hal_response['ETag'])
+
+    def test_vote_changes_etag(self):
+        etags = {}
+        for path in ('/questions', self.question_path, self.choice_path):
+            etags[path] = self.client.get(path, secure=True)['ETag']
+
+        self.client.post(self.choice_path, secure=True)
+
+        for path, etag in etags.items():
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag, secure=True)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_change_by_another_process_changes_etag(self):
+        response = self.client.get(self.choice_path, secure=True)
+
+        # Another process's cache was invalidated, or none was
+        Choice.objects.update(
+            vote_count=F('vote_count') + 1, modified_at=timezone.now()
+        )
+
+        response = self.client.get(
+            self.choice_path, HTTP_IF_NONE_MATCH=response['ETag'], secure=True
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['votes'], 1)
+
+    def test_feature_flags_change_etag(self):
+        flags = FeatureFlags(mock.Mock())
+        flags.backend.load.return_value = {'choice.vote': True}
+        flags.load()
+        Choice.objects.update(modified_at=timezone.now() - timedelta(minutes=1))
+
+        with mock.patch('polls.features.feature_flags', flags), mock.patch(
+            'polls.views.feature_flags', flags
+        ):
+            response = self.client.get(self.choice_path, secure=True)
+            self.assertIn('POST', response['Allow'])
+
+            flags.backend.load.return_value = {'choice.vote': False}
+            flags.reload()
+
+            changed = self.client.get(
+                self.choice_path, HTTP_IF_NONE_MATCH=response['ETag'], secure=True
+            )
+            self.assertEqual(changed.status_code, 200)
+            self.assertNotIn('POST', changed['Allow'])
+
+    def test_not_modified_skips_rendering(self):
+        etag = self.client.get(self.question_path, secure=True)['ETag']
+
+        with mock.patch.object(QuestionResource, 'get_response') as get_response:
+            response = self.client.get(
+                self.question_path, HTTP_IF_NONE_MATCH=etag, secure=True
+            )
+
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(get_response.called)
+
+    def test_cached_response_reads_version_only(self):
+        for path in ('/questions', self.question_path, self.choice_path):
+            self.client.get(path, secure=True)
+
+            with self.assertNumQueries(1):
+                response = self.client.get(path, secure=True)
+            self.assertEqual(response.status_code, 200)
+
+    def test_responses_are_cached_by_generation(self):
+        question = Question.objects.get()
+        resource = QuestionResource(kwargs={'pk': question.pk})
+        key = resource.get_cache_key('application/json')
+        self.assertEqual(resource.get_cache_key('application/json'), key)
+
+        invalidate_questions(question.pk)
+        self.assertNotEqual(resource.get_cache_key('application/json'), key)
+
+    def test_writes_bump_generations(self):
+        question = Question.objects.get()
+        keys = [QUESTIONS, question_key(question.pk)]
+        generations = get_generations(keys)
+
+        self.client.post(self.choice_path, secure=True)
+        voted = get_generations(keys)
+        self.assertNotEqual(voted[0], generations[0])
+        self.assertNotEqual(voted[1], generations[1])
+
+        self.client.post(
+            '/questions',
+            json.dumps({'question': 'Created?', 'choices': ['A', 'B']}),
+            content_type='application/json',
+            secure=True,
+        )
+        created = get_generations(keys)
+        self.assertNotEqual(created[0], voted[0])
+        self.assertEqual(created[1], voted[1])
+
+        deletable = Question.objects.create(pk=100, question_text='Deletable?')
+        keys.append(question_key(deletable.pk))
+        generations = get_generations(keys)
+        response = self.client.delete('/questions/100', secure=True)
+        self.assertEqual(response.status_code, 204)
+        deleted = get_generations(keys)
+        self.assertNotEqual(deleted[0], generations[0])
+        self.assertEqual(deleted[1], generations[1])
+        self.assertNotEqual(deleted[2], generations[2])
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Fails when a query on a hot path cannot use an index and falls back to a
+    sequential scan of the table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        choice_texts = ('A', 'B', 'C', 'D')
+        Question.objects.bulk_create(
+            Question(
+                question_text='Question {}?'.format(i),
+                fingerprint=fingerprint('Question {}?'.format(i), choice_texts),
+            )
+            for i in range(500)
+        )
+        Choice.objects.bulk_create(
+            Choice(question=question, choice_text=choice_text, vote_count=1)
+            for question in Question.objects.all()
+            for choice_text in choice_texts
+        )
+        Vote.objects.bulk_create(Vote(choice=choice) for choice in Choice.objects.all())
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndexes(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Small tables are cheaper to scan, only fall back to a
+                # sequential scan when there is no usable index
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+            self.assertNotIn('Seq Scan', plan, plan)
+        elif connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            for line in plan.splitlines():
+                if re.search(r'\bSCAN\b', line):
+                    self.assertIn('USING', line, plan)
+        else:
+            self.skipTest('Query plans are not checked on {}'.format(connection.vendor))
+
+    def test_question_collection(self):
+        resource = QuestionCollectionResource()
+        question = Question.objects.order_by('published_at')[250]
+        values = [question.published_at, question.pk]
+
+        self.assertUsesIndexes(resource.get_paginator().page(2).object_list)
+        self.assertUsesIndexes(resource.get_cursor_objects('next', None))
+        self.assertUsesIndexes(resource.get_cursor_objects('next', values))
+        self.assertUsesIndexes(resource.get_cursor_objects('prev', values))
+
+    def test_question_choices(self):
+        question = Question.objects.first()
+
+        self.assertUsesIndexes(question.choices.order_by('-vote_count', 'choice_text'))
+        self.assertUsesIndexes(
+            Choice.objects.filter(question_id__in=[1, 2, 3]).order_by(
+                '-vote_count', 'choice_text'
+            )
+        )
+
+    def test_question_lookup(self):
+        self.assertUsesIndexes(
+            Question.objects.filter(fingerprint__in=['a', 'b']).order_by()
+        )
+
+    def test_cleanup(self):
+        command = CleanupCommand()
+        command.batch_size = 100
+        questions = command.get_expired_questions(age=0)
+        question = Question.objects.order_by('published_at')[250]
+        fields = ('published_at', 'id')
+
+        self.assertUsesIndexes(command.get_batch(questions, fields, None))
+        self.assertUsesIndexes(
+            command.get_batch(questions, fields, (question.published_at, question.pk))
+        )
+        self.assertUsesIndexes(command.get_batch(Vote.objects.all(), ('id',), (100,)))
+        self.assertUsesIndexes(
+            command.get_batch(Choice.objects.filter(vote_count__gt=0), ('id',), (100,))
+        )
+
+    def test_choice_votes(self):
+        self.assertUsesIndexes(Vote.objects.filter(choice_id=1))
+
+
+class FakeConnection(object):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTestCase(TestCase):
+    def test_connections_are_reused(self):
+        pool = ConnectionPool(max_size=2)
+        connection = pool.get(FakeConnection)
+        pool.put(connection)
+
+        self.assertIs(pool.get(FakeConnection), connection)
+        self.assertEqual(
+            pool.get_stats(), {'size': 1, 'max_size': 2, 'in_use': 1, 'waiting': 0}
+        )
+
+    def test_waits_for_a_connection(self):
+        pool = ConnectionPool(max_size=1, timeout=0.01)
+        pool.get(FakeConnection)
+
+        with self.assertRaises(PoolTimeout):
+            pool.get(FakeConnection)
+
+    def test_broken_connections_are_closed(self):
+        pool = ConnectionPool(max_size=1)
+        connection = pool.get(FakeConnection)
+        pool.put(connection, broken=True)
+
+        self.assertTrue(connection.closed)
+        self.assertIsNot(pool.get(FakeConnection), connection)
+        self.assertEqual(pool.get_stats()['size'], 1)
+
+    def test_failed_connect_frees_its_slot(self):
+        pool = ConnectionPool(max_size=1)
+
+        with self.assertRaises(OperationalError):
+            pool.get(mock.Mock(side_effect=OperationalError('unavailable')))
+
+        self.assertEqual(pool.get_stats()['size'], 0)
+        pool.get(FakeConnection)
+
+    def test_idle_connections_are_closed(self):
+        pool = ConnectionPool(min_size=1, max_size=3, max_idle=0)
+        fakes = [pool.get(FakeConnection) for _ in range(3)]
+        for fake in fakes:
+            pool.put(fake)
+
+        self.assertEqual([fake.closed for fake in fakes], [True, True, False])
+        self.assertEqual(
+            pool.get_stats(), {'size': 1, 'max_size': 3, 'in_use': 0, 'waiting': 0}
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'requires PostgreSQL')
+    def test_backend_reuses_connections(self):
+        from polls.backends.postgresql.base import DatabaseWrapper
+
+        with override_settings(DATABASE_POOL_MAX_SIZE=1):
+            wrapper = DatabaseWrapper(dict(connection.settings_dict), alias='pooled')
+            wrapper.ensure_connection()
+            raw = wrapper.connection
+            wrapper.close()
+            wrapper.ensure_connection()
+
+            self.assertIs(wrapper.connection, raw)
+            self.assertEqual(wrapper.pool.get_stats()['in_use'], 1)
+            wrapper.close()
+            wrapper.pool.close()
+
+
 class HealthCheckTests(TestCase):
     def setUp(self):
         self.client = Client()
+        cache.clear()
+        database_probe.invalidate()
 
     def test_healthy(self):
         response = self.client.get('/healthcheck', secure=True)
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/health+json')
+        body = json.loads(response.content)
+        self.assertEqual(body['status'], 'ok')
+        self.assertEqual(body['checks']['database:responseTime'][0]['status'], 'pass')
+
+    def test_database_is_probed_once_per_interval(self):
+        self.client.get('/healthcheck', secure=True)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/healthcheck', secure=True)
+
+        self.assertEqual(response.status_code, 200)
+
+        database_probe.invalidate()
+        with self.assertNumQueries(1):
+            self.client.get('/healthcheck', secure=True)
+
+    def test_database_inaccessible(self):
+        with mock.patch.object(
+            connection, 'cursor', side_effect=OperationalError('unavailable')
+        ):
+            response = self.client.get('/healthcheck', secure=True)
+
+        self.assertEqual(response.status_code, 503)
+        body = json.loads(response.content)
+        self.assertEqual(body['status'], 'fail')
+        self.assertEqual(body['checks']['database:responseTime'][0]['status'], 'fail')
+
+    def test_pool_stats(self):
+        pool = ConnectionPool(max_size=2)
+        pool.get(FakeConnection)
+
+        with mock.patch('polls.health.connections', {'default': mock.Mock(pool=pool)}):
+            self.assertEqual(
+                get_pool_stats('default'),
+                {'size': 1, 'max_size': 2, 'in_use': 1, 'waiting': 0},
+            )
+
+        with mock.patch('polls.health.connections', {'default': mock.Mock(spec=[])}):
+            self.assertIsNone(get_pool_stats('default'))
+
+    def test_pool_saturation(self):
+        stats = {'size': 2, 'max_size': 2, 'in_use': 2, 'waiting': 1}
+
+        with mock.patch('polls.urls.get_pool_stats', return_value=stats):
+            response = self.client.get('/healthcheck', secure=True)
+
         self.assertEqual(
-            json.loads(response.content),
-            {
-                'status': 'ok',
-            },
+            json.loads(response.content)['checks']['database:connections'],
+            [
+                {
+                    'componentType': 'datastore',
+                    'observedValue': 2,
+                    'observedUnit': 'connections',
+                    'status': 'warn',
+                    'poolSize': 2,
+                    'maxPoolSize': 2,
+                    'waiting': 1,
+                }
+            ],
         )
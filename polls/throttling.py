@@ -0,0 +1,133 @@
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+def get_client(request):
+    """
+    Identifies the client of a request by the `THROTTLE_CLIENT_HEADER`. The
+    last address of a list such as `X-Forwarded-For` is used, which is the one
+    appended by the proxy in front of the application.
+    """
+
+    value = request.META.get(settings.THROTTLE_CLIENT_HEADER) or ''
+    return value.split(',')[-1].strip()
+
+
+class TokenBucket(object):
+    """
+    Allows each client `rate` requests a second, and bursts of up to `burst`
+    requests. Buckets are kept in the cache, and are therefore shared between
+    processes when the cache is.
+
+    Rather than counting tokens each bucket stores the time by which it will
+    be full again, so taking a token is a single read and write of the cache.
+    Concurrent requests of a client may both take the last token.
+    """
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+
+    def take(self, client):
+        """
+        Takes a token from the client's bucket, returning `0` or the number
+        of seconds until a token is available.
+        """
+
+        if not self.rate:
+            return 0
+
+        key = 'polls:throttle:{}:{}'.format(self.name, client)
+        interval = 1 / self.rate
+        now = time.time()
+        full_at = max(cache.get(key, now), now) + interval
+        wait = full_at - now - self.burst * interval
+
+        if wait > 0:
+            return wait
+
+        cache.set(key, full_at, math.ceil(full_at - now))
+        return 0
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse(status=429)
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+class IdempotencyCache(object):
+    """
+    Replays the response to a request with an `Idempotency-Key` header which
+    was already made by the client to the same URI, instead of handling it
+    again. Requests repeated while the first is in progress are rejected
+    with `409 Conflict`, for at most `lock_timeout` seconds should the
+    process handling the first request die.
+
+    Only the status, headers and body of responses are cached, streamed
+    responses and server errors are not replayed.
+    """
+
+    header = 'HTTP_IDEMPOTENCY_KEY'
+    in_progress = 'in-progress'
+
+    def __init__(self, name, timeout, lock_timeout):
+        self.name = name
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+
+    def get_cache_key(self, request, client):
+        key = '{}\n{}\n{}'.format(client, request.path, request.META[self.header])
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        return 'polls:idempotency:{}:{}'.format(self.name, digest)
+
+    def respond(self, request, client, handler):
+        if self.header not in request.META:
+            return handler()
+
+        key = self.get_cache_key(request, client)
+
+        if not cache.add(key, self.in_progress, self.lock_timeout):
+            cached = cache.get(key)
+            if cached is None:
+                # The first request failed or expired meanwhile
+                return self.respond(request, client, handler)
+            if cached == self.in_progress:
+                return HttpResponse(status=409)
+            return self.replay(cached)
+
+        stored = False
+        try:
+            response = handler()
+            if response.status_code < 500 and not response.streaming:
+                cached = (
+                    response.status_code,
+                    list(response.items()),
+                    response.content,
+                )
+                cache.set(key, cached, self.timeout)
+                stored = True
+        finally:
+            if not stored:
+                cache.delete(key)
+
+        return response
+
+    def replay(self, cached):
+        status, headers, content = cached
+        response = HttpResponse(content, status=status)
+        for header, value in headers:
+            response[header] = value
+        return response
+
+
+vote_bucket = TokenBucket('vote', settings.VOTE_RATE, settings.VOTE_BURST)
+vote_idempotency = IdempotencyCache(
+    'vote', settings.IDEMPOTENCY_TIMEOUT, settings.IDEMPOTENCY_LOCK_TIMEOUT
+)
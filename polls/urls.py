@@ -1,34 +1,50 @@
-from django.core.exceptions import ImproperlyConfigured
-from django.db import connections
-from django.db.utils import OperationalError
+from django.conf import settings
 from django.http import JsonResponse
 from django.urls import path
 
-from polls.views import (
-    ChoiceResource,
-    QuestionCollectionResource,
-    QuestionResource,
-    RootResource,
-)
+from polls import views
+from polls.health import database_probe, get_pool_stats
+from polls.instrumentation import metrics_view
 
 
 def healthcheck_view(request):
     content_type = 'application/health+json'
-    database_accessible = True
+    database = database_probe.check()
+    checks = {
+        'database:responseTime': [
+            {
+                'componentType': 'datastore',
+                'observedValue': round(database['duration'] * 1000, 2),
+                'observedUnit': 'ms',
+                'status': 'pass' if database['accessible'] else 'fail',
+                'time': database['time'].isoformat(),
+            }
+        ]
+    }
 
-    try:
-        connections['default'].cursor()
-    except ImproperlyConfigured:
-        # Database is not configured (DATABASE_URL may not be set)
-        database_accessible = False
-    except OperationalError:
-        # Database is not accessible
-        database_accessible = False
+    pool = get_pool_stats('default')
+    if pool is not None:
+        saturated = pool['waiting'] or pool['in_use'] >= pool['max_size']
+        checks['database:connections'] = [
+            {
+                'componentType': 'datastore',
+                'observedValue': pool['in_use'],
+                'observedUnit': 'connections',
+                'status': 'warn' if saturated else 'pass',
+                'poolSize': pool['size'],
+                'maxPoolSize': pool['max_size'],
+                'waiting': pool['waiting'],
+            }
+        ]
 
-    if database_accessible:
-        return JsonResponse({'status': 'ok'}, content_type=content_type)
+    if database['accessible']:
+        return JsonResponse(
+            {'status': 'ok', 'checks': checks}, content_type=content_type
+        )
 
-    return JsonResponse({'status': 'fail'}, status=503, content_type=content_type)
+    return JsonResponse(
+        {'status': 'fail', 'checks': checks}, status=503, content_type=content_type
+    )
 
 
 def error_view(request):
@@ -36,10 +52,17 @@ def error_view(request):
 
 
 urlpatterns = [
-    path('', RootResource.as_view()),
-    path('questions', QuestionCollectionResource.as_view()),
-    path('questions/<int:pk>', QuestionResource.as_view()),
-    path('questions/<int:question_pk>/choices/<int:pk>', ChoiceResource.as_view()),
+    path('', views.RootResource.as_view()),
+    path('questions', views.QuestionCollectionResource.as_view()),
+    path('questions/<int:pk>', views.QuestionResource.as_view()),
+    path(
+        'questions/<int:question_pk>/choices/<int:pk>',
+        views.ChoiceResource.as_view(),
+    ),
+    path('questions/<int:pk>/tally', views.QuestionTallyView.as_view()),
     path('healthcheck', healthcheck_view),
     path('500', error_view),
 ]
+
+if settings.INSTRUMENTATION:
+    urlpatterns.append(path('metrics', metrics_view))
@@ -1,38 +1,121 @@
 import json
 
 import jsonschema
-from django.db.models import Count
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, Max, Prefetch
 from django.http import Http404, HttpResponse
-
-from polls.features import can_create_question, can_delete_question, can_vote_choice
-from polls.models import Choice, Question
+from django.utils.http import parse_etags, quote_etag
+from django.views.generic import View
+
+from polls.features import (
+    can_create_question,
+    can_delete_question,
+    can_vote_choice,
+    feature_flags,
+)
+from polls.generations import QUESTIONS, invalidate_questions, question_key
+from polls.models import Choice, Question, fingerprint
 from polls.resource import (
     Action,
     Attribute,
+    CachedCount,
     CollectionResource,
+    EstimatedCount,
     Resource,
     SingleObjectMixin,
 )
+from polls.tallies import broker as tally_broker
+from polls.throttling import (
+    get_client,
+    too_many_requests,
+    vote_bucket,
+    vote_idempotency,
+)
+from polls.votes import vote
+
+
+def get_last_modified(*times):
+    """
+    Returns the latest of the times a resource's data was modified.
+    """
+
+    return max(value for value in times if value)
+
+
+def get_state(*values):
+    """
+    Returns the state of a resource from a summary of its data and the
+    generation of the feature flags which decide its actions.
+    """
+
+    return values + (feature_flags.get_generation(),)
 
 
 class RootResource(Resource):
     uri = '/'
     cache_max_age = 3600
+    cache_timeout = settings.RESPONSE_CACHE_TIMEOUT
 
     def get_relations(self):
         return {
             'questions': QuestionCollectionResource(),
         }
 
+    def get_state(self):
+        return get_state()
+
     def can_embed(self, relation):
         return False
 
 
 class QuestionResource(Resource, SingleObjectMixin):
     model = Question
+    cache_max_age = settings.RESPONSE_MAX_AGE
+    cache_timeout = settings.RESPONSE_CACHE_TIMEOUT
 
     def get_uri(self):
-        return '/questions/{}'.format(self.get_object().pk)
+        return '/questions/{}'.format(self.get_pk())
+
+    def get_queryset(self):
+        # The question is read along with the summary of its choices which
+        # its version and Last-Modified are derived from
+        return Question.objects.annotate(
+            choices_modified_at=Max('choices__modified_at'),
+            choice_count=Count('choices'),
+        )
+
+    def get_summary(self):
+        """
+        Returns the question with the time its choices were last modified
+        and their number.
+        """
+
+        question = self.get_object()
+        if hasattr(question, 'choice_count'):
+            return question
+
+        # Questions which were not read by `get_object`, such as those which
+        # were just created, usually come with their choices
+        choices = getattr(question, 'ordered_choices', None)
+        if choices is None:
+            summary = question.choices.aggregate(Max('modified_at'), Count('id'))
+            question.choices_modified_at = summary['modified_at__max']
+            question.choice_count = summary['id__count']
+        else:
+            question.choices_modified_at = max(
+                (choice.modified_at for choice in choices), default=None
+            )
+            question.choice_count = len(choices)
+
+        return question
+
+    def get_state(self):
+        summary = self.get_summary()
+        return get_state(summary.choices_modified_at, summary.choice_count)
+
+    def get_generation_keys(self):
+        return (question_key(self.get_pk()),)
 
     def get_attributes(self):
         question = self.get_object()
@@ -42,12 +125,17 @@ class QuestionResource(Resource, SingleObjectMixin):
             'published_at': question.published_at.isoformat(),
         }
 
+    def get_choices(self):
+        question = self.get_object()
+
+        if hasattr(question, 'ordered_choices'):
+            # Choices were prefetched by `QuestionCollectionResource`
+            return question.ordered_choices
+
+        return question.choices.order_by('-vote_count', 'choice_text')
+
     def get_relations(self):
-        choices = (
-            self.get_object()
-            .choices.annotate(vote_count=Count('votes'))
-            .order_by('-vote_count', 'choice_text')
-        )
+        choices = self.get_choices()
 
         def choice_resource(choice):
             resource = ChoiceResource()
@@ -59,6 +147,10 @@ class QuestionResource(Resource, SingleObjectMixin):
             'choices': list(map(choice_resource, choices)),
         }
 
+    def get_last_modified(self):
+        summary = self.get_summary()
+        return get_last_modified(summary.published_at, summary.choices_modified_at)
+
     def get_actions(self):
         actions = {}
 
@@ -84,28 +176,55 @@ class QuestionResource(Resource, SingleObjectMixin):
         if not can_delete_question(question, request):
             return self.http_method_not_allowed(request)
 
+        pk = question.pk
         question.delete()
+        invalidate_questions(pk)
+        QuestionCollectionResource.count_provider.invalidate()
         return HttpResponse(status=204)
 
 
 class ChoiceResource(Resource, SingleObjectMixin):
     model = Choice
+    cache_max_age = settings.RESPONSE_MAX_AGE
+    cache_timeout = settings.RESPONSE_CACHE_TIMEOUT
 
     def get_uri(self):
-        choice = self.get_object()
-        return '/questions/{}/choices/{}'.format(choice.question.pk, choice.pk)
+        # Called for every choice of a rendered collection
+        choice = getattr(self, 'obj', None)
+        if choice:
+            return '/questions/{}/choices/{}'.format(choice.question_id, choice.pk)
+
+        return '/questions/{}/choices/{}'.format(
+            self.kwargs['question_pk'], self.kwargs['pk']
+        )
+
+    def get_question_pk(self):
+        obj = getattr(self, 'obj', None)
+        if obj:
+            return obj.question_id
+
+        return self.kwargs['question_pk']
+
+    def get_queryset(self):
+        return Choice.objects.filter(question_id=self.kwargs['question_pk'])
+
+    def get_state(self):
+        return get_state(self.get_object().modified_at)
+
+    def get_generation_keys(self):
+        return (question_key(self.get_question_pk()),)
 
     def get_attributes(self):
         choice = self.get_object()
 
-        if not hasattr(choice, 'vote_count'):
-            choice.vote_count = choice.votes.count()
-
         return {
             'choice': choice.choice_text,
             'votes': choice.vote_count,
         }
 
+    def get_last_modified(self):
+        return get_last_modified(self.get_object().modified_at)
+
     def get_actions(self):
         actions = {}
 
@@ -126,22 +245,78 @@ class ChoiceResource(Resource, SingleObjectMixin):
         if not can_vote_choice(self.request):
             return self.http_method_not_allowed(request)
 
+        # Rejected before touching the database
+        client = get_client(request)
+        retry_after = vote_bucket.take(client)
+        if retry_after:
+            return too_many_requests(retry_after)
+
+        return vote_idempotency.respond(
+            request, client, lambda: self.record_vote(request)
+        )
+
+    def record_vote(self, request):
         try:
             choice = self.get_object()
         except self.model.DoesNotExist:
             raise Http404('Choice does not exist')
 
-        choice.vote()
-        response = self.get(request)
+        vote(choice)
+        tally_broker.publish(choice.question_id)
+
+        # The vote may still be buffered, the response renders the choice as
+        # counted here rather than a cached response
+        self.memoize()
+        response = self.render(request, self.determine_content_type(request))
         response.status_code = 201
         return response
 
 
+class QuestionTallyView(View):
+    """
+    Answers with the vote counts of a question's choices at once, or with a
+    304 when they have not changed since the `If-None-Match` header. Clients
+    watching the counts poll it, the counts are kept by the tally broker so
+    polls cost no queries of their own.
+    """
+
+    def get(self, request, pk):
+        tally = tally_broker.get(pk)
+        if tally is None:
+            raise Http404()
+
+        digest, data = tally
+        if digest in self.get_digests(request):
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(data, content_type='application/json')
+
+        response['ETag'] = quote_etag(digest)
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    def get_digests(self, request):
+        """
+        Returns the digests of the tallies the client has already received.
+        """
+
+        etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        return [etag.replace('W/', '', 1).strip('"') for etag in etags]
+
+
 class QuestionCollectionResource(CollectionResource):
     resource = QuestionResource
     model = Question
     relation = 'questions'
     uri = '/questions'
+    cache_max_age = settings.RESPONSE_MAX_AGE
+    cache_timeout = settings.RESPONSE_CACHE_TIMEOUT
+    pagination = 'cursor'
+    cursor_ordering = ('-published_at', '-id')
+    count_provider = EstimatedCount(
+        settings.COUNT_ESTIMATE_THRESHOLD,
+        CachedCount('polls:questions:count', settings.COUNT_CACHE_TIMEOUT),
+    )
 
     request_body_schema = {
         'type': 'object',
@@ -152,6 +327,13 @@ class QuestionCollectionResource(CollectionResource):
         'required': ['question', 'choices'],
     }
 
+    batch_request_body_schema = {
+        'type': 'array',
+        'items': request_body_schema,
+        'minItems': 1,
+        'maxItems': 1000,
+    }
+
     def get_actions(self):
         actions = {}
 
@@ -166,6 +348,20 @@ class QuestionCollectionResource(CollectionResource):
 
         return actions
 
+    def get_state(self):
+        # Every change to the questions creates, deletes or modifies choices
+        summary = Choice.objects.aggregate(Max('modified_at'), Count('id'))
+        return get_state(summary['modified_at__max'], summary['id__count'])
+
+    def get_generation_keys(self):
+        return (QUESTIONS,)
+
+    def get_objects(self):
+        choices = Choice.objects.order_by('-vote_count', 'choice_text')
+        return Question.objects.prefetch_related(
+            Prefetch('choices', queryset=choices, to_attr='ordered_choices')
+        )
+
     def post(self, request):
         if not can_create_question(self.request):
             return self.http_method_not_allowed(request)
@@ -175,6 +371,9 @@ class QuestionCollectionResource(CollectionResource):
         except ValueError:
             return HttpResponse(status=400)
 
+        if isinstance(body, list):
+            return self.post_batch(request, body)
+
         try:
             jsonschema.validate(body, self.request_body_schema)
         except jsonschema.ValidationError:
@@ -193,26 +392,110 @@ class QuestionCollectionResource(CollectionResource):
         response['Location'] = resource.get_uri()
         return response
 
-    def create_question(self, question_text, choice_texts):
-        question = Question(question_text=question_text)
-        question.save()
+    def post_batch(self, request, body):
+        """
+        Creates every question in a list of questions, responding with the
+        created (or existing) questions.
+        """
 
-        for choice_text in choice_texts:
-            Choice(question=question, choice_text=choice_text).save()
+        try:
+            jsonschema.validate(body, self.batch_request_body_schema)
+        except jsonschema.ValidationError:
+            return HttpResponse(status=400)
 
-        return question
+        questions = [(q['question'], q['choices']) for q in body]
+        results = self.get_or_create_many(questions)
 
-    def get_or_create(self, question_text, choice_texts):
-        try:
-            question = Question.objects.filter(question_text=question_text).first()
-        except Question.DoesNotExist:
-            question = None
+        resource = self.__class__()
+        resource.request = request
+        resource.get_relations = lambda: {
+            resource.relation: resource.get_resources(q for (q, _) in results)
+        }
+        response = resource.render(request, self.determine_content_type(request))
+        if any(created for (_, created) in results):
+            response.status_code = 201
+        return response
 
-        if question:
-            choices = list(
-                map(lambda c: c.choice_text, question.choices.order_by('choice_text'))
-            )
-            if choices == sorted(choice_texts):
-                return (question, False)
+    def create_question(self, question_text, choice_texts):
+        return self.create_questions([(question_text, choice_texts)])[0]
+
+    def create_questions(self, questions):
+        """
+        Creates questions from a list of `(question_text, choice_texts)`
+        tuples in a single transaction, inserting all questions and then all
+        choices in bulk.
+        """
+
+        objects = [
+            Question(question_text=text, fingerprint=fingerprint(text, choice_texts))
+            for (text, choice_texts) in questions
+        ]
+        features = connections[Question.objects.db].features
+        can_return_pks = getattr(
+            features,
+            'can_return_rows_from_bulk_insert',
+            getattr(features, 'can_return_ids_from_bulk_insert', False),
+        )
 
-        return (self.create_question(question_text, choice_texts), True)
+        if not objects:
+            return []
+
+        with transaction.atomic():
+            if can_return_pks:
+                Question.objects.bulk_create(objects)
+            else:
+                for question in objects:
+                    question.save()
+
+            choices = []
+            for question, (_, choice_texts) in zip(objects, questions):
+                question.ordered_choices = [
+                    Choice(question=question, choice_text=choice_text)
+                    for choice_text in sorted(choice_texts)
+                ]
+                choices += question.ordered_choices
+
+            if can_return_pks:
+                Choice.objects.bulk_create(choices)
+            else:
+                for choice in choices:
+                    choice.save()
+
+        invalidate_questions()
+        self.count_provider.invalidate()
+        return objects
+
+    def get_or_create(self, question_text, choice_texts):
+        return self.get_or_create_many([(question_text, choice_texts)])[0]
+
+    def get_or_create_many(self, questions):
+        """
+        Returns a list of `(question, created)` tuples for a list of
+        `(question_text, choice_texts)` tuples, only creating the questions
+        that do not already exist with the same choices.
+        """
+
+        fingerprints = [fingerprint(*question) for question in questions]
+
+        for attempt in range(3):
+            lookup = self.get_objects().filter(fingerprint__in=set(fingerprints))
+            existing = {
+                question.fingerprint: question for question in lookup.order_by()
+            }
+
+            missing = {}
+            for question, value in zip(questions, fingerprints):
+                if value not in existing:
+                    missing.setdefault(value, question)
+
+            try:
+                created = self.create_questions(list(missing.values()))
+            except IntegrityError:
+                # A concurrent request created one of the questions, it will
+                # be found when looking the questions up again
+                if attempt == 2:
+                    raise
+                continue
+
+            existing.update(zip(missing.keys(), created))
+            return [(existing[value], value in missing) for value in fingerprints]
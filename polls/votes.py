@@ -0,0 +1,127 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from polls.generations import invalidate_questions
+from polls.models import Choice, Vote
+
+logger = logging.getLogger(__name__)
+
+
+class VoteBuffer(object):
+    """
+    Collects votes in memory and writes them with a single `bulk_create`
+    once `size` votes are pending or `interval` seconds have passed.
+
+    Votes which have not been flushed are lost if the process crashes, the
+    `size` and `interval` therefore bound how many votes may be lost. Votes
+    which failed to be written are kept and written with the next flush.
+    """
+
+    def __init__(self, size, interval=None):
+        self.size = size
+        self.interval = interval
+        self.pending = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def __len__(self):
+        with self.lock:
+            return sum(self.pending.values())
+
+    def add(self, choice):
+        with self.lock:
+            self.pending[choice.pk] += 1
+            should_flush = sum(self.pending.values()) >= self.size
+
+        if should_flush:
+            try:
+                self.flush()
+            except Exception:
+                # The vote is kept, and counted once the database recovers
+                logger.exception('Failed to flush votes')
+        else:
+            self.start()
+
+    def count(self, choice):
+        with self.lock:
+            return self.pending[choice.pk]
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+
+        if not pending:
+            return 0
+
+        try:
+            with transaction.atomic():
+                # Choices may have been deleted since the vote was buffered
+                choices = Choice.objects.filter(pk__in=pending.keys())
+                now = timezone.now()
+                votes = []
+                question_pks = set()
+                for choice_pk, question_pk in choices.values_list('pk', 'question_id'):
+                    question_pks.add(question_pk)
+                    count = pending[choice_pk]
+                    votes += [Vote(choice_id=choice_pk) for _ in range(count)]
+                    Choice.objects.filter(pk=choice_pk).update(
+                        vote_count=F('vote_count') + count, modified_at=now
+                    )
+
+                Vote.objects.bulk_create(votes)
+        except Exception:
+            # The votes were already acknowledged, put them back
+            with self.lock:
+                self.pending.update(pending)
+            raise
+
+        if question_pks:
+            invalidate_questions(*question_pks)
+        return len(votes)
+
+    def start(self):
+        if not self.interval or self.thread is not None:
+            return
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            close_old_connections()
+
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush votes')
+
+
+if settings.VOTE_BUFFER_SIZE > 1:
+    vote_buffer = VoteBuffer(settings.VOTE_BUFFER_SIZE, settings.VOTE_BUFFER_INTERVAL)
+    atexit.register(vote_buffer.flush)
+else:
+    vote_buffer = None
+
+
+def vote(choice):
+    """
+    Records a vote on the choice, through the vote buffer when enabled.
+    """
+
+    if vote_buffer is None:
+        choice.vote()
+        invalidate_questions(choice.question_id)
+        return
+
+    vote_buffer.add(choice)
+    choice.refresh_from_db(fields=['vote_count'])
+    choice.vote_count += vote_buffer.count(choice)